@@ -6,7 +6,7 @@
 {
     'name': 'Webservice Integration',
     'summary': 'Webservice Integration',
-    'version': '13.0.1.0.0',
+    'version': '13.0.2.0.0',
     'category': 'Account',
     'author': 'QubiQ',
     'website': 'https://www.qubiq.es',
@@ -18,6 +18,8 @@
         "views/menu.xml",
         "views/webservice_instance_view.xml",
         "views/webservice_mapper_view.xml",
+        "views/webservice_sync_run_view.xml",
+        "views/webservice_sync_error_view.xml",
         "wizards/export_mappers.xml",
         "wizards/import_mappers.xml",
     ],
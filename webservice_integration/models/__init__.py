@@ -5,3 +5,7 @@ from . import webservice_instance
 from . import webservice_mapper
 from . import webservice_mapper_fields
 from . import webservice_connector
+from . import webservice_sync_hash
+from . import webservice_sync_run
+from . import webservice_sync_error
+from . import webservice_metadata
@@ -10,6 +10,11 @@ try:
     import xmlrpc.client
 except (ImportError, IOError) as err:
     _logger.debug(err)
+from ..tools.jsonrpc import JsonRpcProxy, xmlrpc_proxy
+from ..tools.sql_domain import SQLDomainCompiler, split_in_domain
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 try:
     import mysql.connector
     from mysql.connector import errorcode
@@ -19,6 +24,15 @@ try:
     import pymssql
 except (ImportError, IOError) as err:
     _logger.debug(err)
+import sqlite3
+import csv
+import os
+from ..tools.row_filter import compile_domain, domain_fields
+try:
+    import pyarrow.parquet as pq
+except (ImportError, IOError) as err:
+    pq = None
+    _logger.debug(err)
 
 
 class WebserviceConnector(models.AbstractModel):
@@ -31,25 +45,174 @@ class WebserviceConnector(models.AbstractModel):
     def close_connection(self, connexion):
         return None
 
+    def close_connexion(self, connexion):
+        return None
+
+    def is_alive(self, connexion):
+        """Health check of a pooled connexion before it is used"""
+        return True
+
     def check_connection(self, **kargs):
         raise Warning(_('The connexion was succesfull!'))
 
     def read_data(self, connexion, vals, **kargs):
         pass
 
+    def read_data_batches(self, connexion, vals, batch_size=1000, **kargs):
+        """Generator that yields lists of batch_size rows. Connectors that
+        can stream the result from the source should override it"""
+        data = self.read_data(connexion, vals, **kargs) or []
+        for i in range(0, len(data), batch_size):
+            yield data[i:i + batch_size]
+
+    def read_data_multi(self, connexion, vals_list, **kargs):
+        """Returns the result of read_data for each vals of the list"""
+        return [self.read_data(connexion, vals, **kargs)
+                for vals in vals_list]
+
+    def read_column(self, connexion, vals, batch_size=1000, **kargs):
+        """Generator that yields lists with the values of the first field
+        of vals, used when only the keys of the source are needed"""
+        field = vals['fields'][0]
+        for data in self.read_data_batches(
+                connexion, vals, batch_size=batch_size, **kargs):
+            yield [row[field] for row in data]
+
     def read_fields(self, conn, table):
         pass
+
+    def read_bounds(self, connexion, vals):
+        """Returns (min, max) of the first field of vals filtered by
+        the domain, (None, None) when there is no data"""
+        low = high = None
+        for data in self.read_data_batches(connexion, vals):
+            for row in data:
+                value = row[vals['fields'][0]]
+                if value is None:
+                    continue
+                low = value if low is None else min(low, value)
+                high = value if high is None else max(high, value)
+        return low, high
+
     def prepare_domain(self, domain):
         """It recives a domain of Odoo [(f,o,v)] and will return
         a domain adapted to the connexion source"""
         pass
 
 
+class WebserviceSQLConnector(models.AbstractModel):
+    """Common methods of the connectors to SQL databases. The domains are
+    compiled to conditions with bound parameters"""
+    _name = 'webservice.con.sql'
+    _inherit = 'webservice.connector'
+    _description = "Webservice SQL Conector"
+
+    # Pair of characters used to quote the identifiers
+    _quote = '""'
+    # Maximum number of parameters sent in a single query
+    _max_params = 2000
+    # Parameter marker of the driver
+    _placeholder = '%s'
+
+    def _get_compiler(self):
+        return SQLDomainCompiler(
+            quote=self._quote, placeholder=self._placeholder)
+
+    def close_connexion(self, conn):
+        try:
+            conn[0].close()
+            conn[1].close()
+            return None
+        except Exception:
+            _logger.info(_('Connection Close Failed'))
+            return None
+
+    def is_alive(self, conn):
+        try:
+            conn[1].execute("SELECT 1 AS alive")
+            conn[1].fetchall()
+            return True
+        except Exception:
+            return False
+
+    def read_fields(self, conn, table):
+        conn[1].execute("""SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+                        WHERE TABLE_NAME = %s""", (table,))
+        data = conn[1].fetchall()
+        return [x['COLUMN_NAME'] if isinstance(x, dict) else x[0]
+                for x in data]
+
+    def prepare_domain(self, values):
+        """Returns the WHERE clause and its parameters"""
+        sql, params = self._get_compiler().compile(values)
+        if not sql:
+            return "", []
+        return "WHERE " + sql, params
+
+    def _prepare_order(self, order):
+        compiler = self._get_compiler()
+        terms = []
+        for term in order.split(','):
+            parts = term.split()
+            if not parts:
+                continue
+            terms.append(' '.join([compiler.quote(parts[0])] + parts[1:]))
+        return ', '.join(terms)
+
+    def _prepare_query(self, values, domain=None):
+        """Returns the query and its parameters, domain replaces the
+        domain of values when it is given"""
+        compiler = self._get_compiler()
+        where, params = self.prepare_domain(
+            values['domain'] if domain is None else domain)
+        query = "SELECT %s FROM %s %s" % (
+            ', '.join(compiler.quote(f) for f in values['fields']),
+            compiler.quote(values['table']), where)
+        if values.get('order'):
+            query += " ORDER BY %s" % self._prepare_order(values['order'])
+        return query, params
+
+    def _split_domain(self, values):
+        """Big IN conditions are sent in several queries"""
+        return split_in_domain(values['domain'], self._max_params)
+
+    def read_data(self, conn, values, **kargs):
+        data = []
+        for domain in self._split_domain(values):
+            conn[1].execute(*self._prepare_query(values, domain))
+            data += conn[1].fetchall()
+        return data
+
+    def read_bounds(self, conn, values):
+        compiler = self._get_compiler()
+        field = compiler.quote(values['fields'][0])
+        where, params = self.prepare_domain(values['domain'])
+        conn[1].execute("SELECT MIN(%s) AS low, MAX(%s) AS high FROM %s %s"
+                        % (field, field, compiler.quote(values['table']),
+                           where), params)
+        row = conn[1].fetchone()
+        if isinstance(row, dict):
+            return row['low'], row['high']
+        return row[0], row[1]
+
+    def read_data_batches(self, conn, values, batch_size=1000, **kargs):
+        """Rows are fetched from the cursor while they are consumed"""
+        for domain in self._split_domain(values):
+            conn[1].execute(*self._prepare_query(values, domain))
+            while True:
+                rows = conn[1].fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+
 class WeberviceSQLSERVERConnector(models.AbstractModel):
     _name = 'webservice.con.sqlserver'
-    _inherit = 'webservice.connector'
+    _inherit = 'webservice.con.sql'
     _description = "Webservice SQL SERVER Conector"
 
+    _quote = '[]'
+
     @api.model
     def connect(self, params, **kargs):
         try:
@@ -65,15 +228,6 @@ class WeberviceSQLSERVERConnector(models.AbstractModel):
         except pymssql.DatabaseError as err:
             raise Warning(str(err))
 
-    def close_connexion(self, conn):
-        try:
-            conn[0].close()
-            conn[1].close()
-            return None
-        except:
-            _logger.info(_('Connection Close Failed'))
-            return None
-
     @api.model
     def check_connection(self, params):
         try:
@@ -84,32 +238,14 @@ class WeberviceSQLSERVERConnector(models.AbstractModel):
             raise UserError(_("Connection Failed! %s" % str(err)))
         return super(WeberviceSQLSERVERConnector, self).check_connection()
 
-    def read_fields(self, conn, table):
-        conn[1].execute("""SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
-                        WHERE TABLE_NAME = '%s'""" % table)
-        data = conn[1].fetchall()
-        return [x[0] for x in data]
-
-    def prepare_domain(self, values):
-        if not values:
-            return ""
-        domain = "WHERE "
-        for x in values:
-            domain += "%s%s'%s' " % (x[0], x[1], x[2])
-        return domain
-
-    def read_data(self, conn, values, **kargs):
-        conn[1].execute("""SELECT %s FROM %s %s
-        """ % (', '.join(values['fields']), values['table'],
-               self.prepare_domain(values['domain'])))
-        return conn[1].fetchall()
-
 
 class WeberviceMySQLConnector(models.AbstractModel):
     _name = 'webservice.con.mysql'
-    _inherit = 'webservice.connector'
+    _inherit = 'webservice.con.sql'
     _description = "Webservice Mysql Connector"
 
+    _quote = '``'
+
     @api.model
     def connect(self, params={}, **kargs):
         try:
@@ -121,7 +257,10 @@ class WeberviceMySQLConnector(models.AbstractModel):
                 database=params.get('db', ''),
                 connect_timeout=params.get('timeout', 300),
             )
-            cursor = conn.cursor(dictionary=kargs.get('dictionary', True))
+            # Unbuffered cursor, rows are read from the server
+            # when they are fetched
+            cursor = conn.cursor(dictionary=kargs.get('dictionary', True),
+                                 buffered=False)
             return [conn, cursor]
         except mysql.connector.Error as err:
             if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
@@ -133,14 +272,12 @@ class WeberviceMySQLConnector(models.AbstractModel):
             else:
                 raise Warning(err)
 
-    def close_connexion(self, connexion):
+    def is_alive(self, connexion):
         try:
-            connexion[0].close()
-            connexion[1].close()
-            return None
+            connexion[0].ping()
         except Exception:
-            _logger.info(_('Connection Close Failed'))
-            return None
+            return False
+        return super(WeberviceMySQLConnector, self).is_alive(connexion)
 
     @api.model
     def check_connection(self, params):
@@ -148,10 +285,196 @@ class WeberviceMySQLConnector(models.AbstractModel):
         self.close_connexion(connexion)
         return super(WeberviceMySQLConnector, self).check_connection()
 
+
+class WebserviceSQLiteConnector(models.AbstractModel):
+    """Connector to a SQLite file, db is the path of the file. Useful as
+    a local source for tests and benchmarks"""
+    _name = 'webservice.con.sqlite'
+    _inherit = 'webservice.con.sql'
+    _description = "Webservice SQLite Conector"
+
+    _placeholder = '?'
+    # Default limit of variables of a SQLite statement
+    _max_params = 999
+
+    @api.model
+    def connect(self, params, **kargs):
+        try:
+            conn = sqlite3.connect(
+                params.get('db', ''), timeout=params.get('timeout', 300),
+                check_same_thread=False)
+        except sqlite3.Error as err:
+            raise Warning(str(err))
+        if kargs.get('dictionary', True):
+            conn.row_factory = lambda cursor, row: {
+                col[0]: value for col, value in zip(cursor.description, row)}
+        return [conn, conn.cursor()]
+
+    def close_connexion(self, conn):
+        try:
+            conn[1].close()
+            conn[0].close()
+            return None
+        except Exception:
+            _logger.info(_('Connection Close Failed'))
+            return None
+
+    @api.model
+    def check_connection(self, params):
+        try:
+            conn = self.connect(params)
+            self.close_connexion(conn)
+        except Exception as err:
+            raise UserError(_("Connection Failed! %s" % str(err)))
+        return super(WebserviceSQLiteConnector, self).check_connection()
+
     def read_fields(self, conn, table):
-        conn[1].execute("""SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
-                        WHERE TABLE_NAME = '%s'""" % table)
-        return conn[1].fetchall
+        conn[1].execute("PRAGMA table_info(%s)" %
+                        self._get_compiler().quote(table))
+        return [x['name'] if isinstance(x, dict) else x[1]
+                for x in conn[1].fetchall()]
+
+
+class WebserviceFileConnector(models.AbstractModel):
+    """Connector to a directory of CSV or Parquet files, db is the path of
+    the directory and each file is a table. The files are read while the
+    rows are consumed and only the requested columns are kept. Parquet
+    files need pyarrow"""
+    _name = 'webservice.con.file'
+    _inherit = 'webservice.connector'
+    _description = "Webservice File Conector"
+
+    _extensions = ['.csv', '.parquet']
+
+    @api.model
+    def connect(self, params, **kargs):
+        directory = params.get('db') or ''
+        if not os.path.isdir(directory):
+            raise Warning(_("Directory %s not found") % directory)
+        return [directory, kargs.get('dictionary', True)]
+
+    @api.model
+    def check_connection(self, params):
+        self.connect(params)
+        return super(WebserviceFileConnector, self).check_connection()
+
+    def _get_path(self, conn, table):
+        for extension in self._extensions:
+            path = os.path.join(conn[0], table + extension)
+            if os.path.isfile(path):
+                return path
+        raise UserError(_("File of the table %s not found") % table)
+
+    def read_fields(self, conn, table):
+        path = self._get_path(conn, table)
+        if path.endswith('.parquet'):
+            return self._get_parquet(path).schema_arrow.names
+        with open(path, newline='', encoding='utf-8-sig') as csv_file:
+            return next(csv.reader(csv_file, self._sniff(csv_file)), [])
+
+    def _get_parquet(self, path):
+        if pq is None:
+            raise UserError(_("pyarrow is needed to read parquet files"))
+        return pq.ParquetFile(path)
+
+    def _sniff(self, csv_file):
+        """Returns the dialect of the file, the file is rewinded"""
+        sample = csv_file.read(64 * 1024)
+        csv_file.seek(0)
+        try:
+            return csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            return csv.excel
+
+    def _read_rows(self, conn, table, columns, batch_size):
+        """Yields lists of rows with columns, None for all of them"""
+        path = self._get_path(conn, table)
+        if path.endswith('.parquet'):
+            for batch in self._get_parquet(path).iter_batches(
+                    batch_size=batch_size, columns=columns):
+                yield batch.to_pylist()
+            return
+        with open(path, newline='', encoding='utf-8-sig') as csv_file:
+            reader = csv.reader(csv_file, self._sniff(csv_file))
+            header = next(reader, [])
+            positions = [(name, i) for i, name in enumerate(header)
+                         if columns is None or name in columns]
+            rows = []
+            for line in reader:
+                # Empty values are read as NULL
+                rows.append({name: line[i] if i < len(line) and line[i]
+                             else None for name, i in positions})
+                if len(rows) >= batch_size:
+                    yield rows
+                    rows = []
+            if rows:
+                yield rows
+
+    def read_data(self, conn, values, **kargs):
+        data = []
+        for rows in self.read_data_batches(conn, values, **kargs):
+            data += rows
+        return data
+
+    def read_data_batches(self, conn, values, batch_size=1000, **kargs):
+        """Rows are read from the file while they are consumed. When an
+        order is required the whole file is read and sorted"""
+        fields = list(values['fields'])
+        columns = fields + sorted(
+            domain_fields(values['domain']) - set(fields))
+        match = compile_domain(values['domain'])
+        order = values.get('order')
+        batches = self._read_rows(conn, values['table'], columns,
+                                  batch_size)
+        if order:
+            rows = [row for batch in batches for row in batch]
+            for term in reversed(order.split(',')):
+                parts = term.split()
+                rows.sort(key=lambda row: (row.get(parts[0]) is not None,
+                                           row.get(parts[0])),
+                          reverse=len(parts) > 1 and
+                          parts[1].lower() == 'desc')
+            batches = (rows[i:i + batch_size]
+                       for i in range(0, len(rows), batch_size))
+        data = []
+        for batch in batches:
+            data += [self._prepare_row(row, fields, conn)
+                     for row in batch if match(row)]
+            while len(data) >= batch_size:
+                yield data[:batch_size]
+                data = data[batch_size:]
+        if data:
+            yield data
+
+    def read_bounds(self, conn, values):
+        """The values of CSV files are text, the numeric values are
+        compared and returned as numbers"""
+        field = values['fields'][0]
+        low = high = None
+        for data in self.read_data_batches(
+                [conn[0], True], dict(values, fields=[field], order=False)):
+            for row in data:
+                value = self._parse_number(row[field])
+                if value is None:
+                    continue
+                low = value if low is None else min(low, value)
+                high = value if high is None else max(high, value)
+        return low, high
+
+    def _parse_number(self, value):
+        if not isinstance(value, str):
+            return value
+        for number_type in (int, float):
+            try:
+                return number_type(value)
+            except ValueError:
+                pass
+        return value
+
+    def _prepare_row(self, row, fields, conn):
+        if conn[1]:
+            return {f: row.get(f) for f in fields}
+        return tuple(row.get(f) for f in fields)
 
 
 class WeberviceOdooConnector(models.AbstractModel):
@@ -161,23 +484,46 @@ class WeberviceOdooConnector(models.AbstractModel):
 
     @api.model
     def connect(self, params={}, **kargs):
+        """Returns [object proxy, db, uid, password, host, protocol].
+        With count_bytes=True the proxy counts the bytes received"""
+        protocol = params.get('protocol') or 'xmlrpc'
         try:
-            common = xmlrpc.client.ServerProxy(
-                '{}/xmlrpc/2/common'.format(params['host'])
-            )
+            if protocol == 'jsonrpc':
+                common = JsonRpcProxy(
+                    params['host'], params.get('timeout', 300))
+            elif kargs.get('count_bytes'):
+                common = xmlrpc_proxy(params['host'], 'common')
+            else:
+                common = xmlrpc.client.ServerProxy(
+                    '{}/xmlrpc/2/common'.format(params['host'])
+                )
             common.version()
             uid = common.authenticate(
                 params['db'], params['user'], params['password'], {}
             )
             if not uid:
                 raise Warning(_("Login/password not valid!"))
-            models = xmlrpc.client.ServerProxy(
-                '{}/xmlrpc/2/object'.format(params['host']))
-            return [models, params['db'], uid, params['password']]
+            if protocol == 'jsonrpc':
+                # The same session is used for all the services
+                models = common
+            else:
+                models = self._get_object_proxy(
+                    params['host'], protocol, **kargs)
+            return [models, params['db'], uid, params['password'],
+                    params['host'], protocol]
         except Exception as er:
             raise Warning(_("Connection with Odoo Failed \n %s" % str(er)))
 
+    def _get_object_proxy(self, host, protocol, **kargs):
+        if protocol == 'jsonrpc':
+            return JsonRpcProxy(host)
+        if kargs.get('count_bytes'):
+            return xmlrpc_proxy(host, 'object')
+        return xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(host))
+
     def close_connexion(self, connexion):
+        if connexion and isinstance(connexion[0], JsonRpcProxy):
+            connexion[0].close()
         conexion = None
         return conexion
 
@@ -207,8 +553,162 @@ class WeberviceOdooConnector(models.AbstractModel):
         return prepared_domain
 
     def read_data(self, conn, values, **kargs):
-        domain = self.prepare_domain(values['domain'])
-        data = conn[0].execute_kw(
-            conn[1], conn[2], conn[3], values['table'],
-            'search_read', [domain], {'fields': values['fields']})
+        data = []
+        for page in self._read_pages(conn, values,
+                                     kargs.get('page_size') or 1000):
+            data += page
         return data
+
+    def read_data_multi(self, conn, vals_list, **kargs):
+        """The reads are sent at the same time by workers threads. Proxies
+        and sessions can't be shared between threads, each thread opens
+        its own one"""
+        workers = kargs.get('workers') or 1
+        if workers < 2 or len(vals_list) < 2:
+            return super(WeberviceOdooConnector, self).read_data_multi(
+                conn, vals_list, **kargs)
+        local = threading.local()
+        proxies = []
+
+        def read(values):
+            if not hasattr(local, 'conn'):
+                local.conn = [self._get_object_proxy(
+                    conn[4], conn[5])] + conn[1:]
+                proxies.append(local.conn)
+            return self.read_data(local.conn, values, **kargs)
+
+        try:
+            with ThreadPoolExecutor(
+                    max_workers=min(workers, len(vals_list))) as executor:
+                return list(executor.map(read, vals_list))
+        finally:
+            for proxy_conn in proxies:
+                self.close_connexion(proxy_conn)
+
+    def read_data_batches(self, conn, values, batch_size=1000, **kargs):
+        """Pages of page_size records are read from the source and
+        yielded in lists of batch_size records"""
+        page_size = kargs.get('page_size') or batch_size
+        if kargs.get('workers', 1) > 1:
+            pages = self._read_pages_parallel(
+                conn, values, page_size, kargs['workers'])
+        else:
+            pages = self._read_pages(conn, values, page_size)
+        data = []
+        for page in pages:
+            data += page
+            while len(data) >= batch_size:
+                yield data[:batch_size]
+                data = data[batch_size:]
+        if data:
+            yield data
+
+    def read_column(self, conn, values, batch_size=1000, **kargs):
+        """The ids are read with search, without reading the records"""
+        order = values.get('order')
+        if values['fields'][0] != 'id' or (order and order != 'id'):
+            return super(WeberviceOdooConnector, self).read_column(
+                conn, values, batch_size=batch_size, **kargs)
+        return self._read_ids(conn, values, batch_size)
+
+    def _read_ids(self, conn, values, batch_size):
+        ids = conn[0].execute_kw(
+            conn[1], conn[2], conn[3], values['table'], 'search',
+            [self.prepare_domain(values['domain'])], {'order': 'id'})
+        for i in range(0, len(ids), batch_size):
+            yield ids[i:i + batch_size]
+
+    def read_bounds(self, conn, values):
+        field = values['fields'][0]
+        domain = self.prepare_domain(values['domain'])
+        domain += [[field, '!=', False]]
+        res = []
+        for order in ['asc', 'desc']:
+            data = conn[0].execute_kw(
+                conn[1], conn[2], conn[3], values['table'], 'search_read',
+                [domain], {'fields': [field], 'limit': 1,
+                           'order': '%s %s' % (field, order)})
+            res.append(data[0][field] if data else None)
+        return tuple(res)
+
+    def _read_pages(self, conn, values, page_size):
+        """Keyset pagination, each page reads the records with an id
+        greater than the last one read. When other order is required
+        the pages are read by offset"""
+        domain = self.prepare_domain(values['domain'])
+        order = values.get('order')
+        if order and order != 'id':
+            order = self._stable_order(order)
+            offset = 0
+            while True:
+                page = conn[0].execute_kw(
+                    conn[1], conn[2], conn[3], values['table'],
+                    'search_read', [domain],
+                    {'fields': values['fields'], 'offset': offset,
+                     'limit': page_size, 'order': order})
+                if not page:
+                    break
+                yield page
+                if len(page) < page_size:
+                    break
+                offset += len(page)
+            return
+        last_id = 0
+        while True:
+            page = conn[0].execute_kw(
+                conn[1], conn[2], conn[3], values['table'], 'search_read',
+                [domain + [['id', '>', last_id]]],
+                {'fields': values['fields'], 'limit': page_size,
+                 'order': 'id'})
+            if not page:
+                break
+            yield page
+            if len(page) < page_size:
+                break
+            last_id = page[-1]['id']
+
+    def _stable_order(self, order):
+        """Adds the id to the order, so the records with the same value
+        keep their position on every page read by offset"""
+        if not order:
+            return 'id'
+        names = [term.split()[0] for term in order.split(',')
+                 if term.strip()]
+        if 'id' in names:
+            return order
+        return '%s, id' % order
+
+    def _read_pages_parallel(self, conn, values, page_size, workers):
+        """Reads the ids of the source records, then reads pages of
+        those ids in several threads keeping the order of the pages"""
+        domain = self.prepare_domain(values['domain'])
+        ids = conn[0].execute_kw(
+            conn[1], conn[2], conn[3], values['table'], 'search',
+            [domain], {'order': self._stable_order(values.get('order'))})
+        # Proxies and sessions can't be shared between threads
+        local = threading.local()
+        proxies = []
+
+        def read_page(page_ids):
+            if not hasattr(local, 'conn'):
+                local.conn = [self._get_object_proxy(
+                    conn[4], conn[5])] + conn[1:]
+                proxies.append(local.conn)
+            return local.conn[0].execute_kw(
+                conn[1], conn[2], conn[3], values['table'], 'read',
+                [page_ids], {'fields': values['fields']})
+
+        pages = (ids[i:i + page_size] for i in range(0, len(ids), page_size))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Only a few pages are read ahead of the consumer
+                futures = deque()
+                for page_ids in pages:
+                    futures.append(executor.submit(read_page, page_ids))
+                    if len(futures) >= workers * 2:
+                        yield futures.popleft().result()
+                while futures:
+                    yield futures.popleft().result()
+        finally:
+            for proxy_conn in proxies:
+                self.close_connexion(proxy_conn)
@@ -7,6 +7,10 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError, Warning
 from odoo.tools import ustr
+from odoo.addons.queue_job.job import job
+from datetime import datetime, timedelta
+from ..tools.connection_pool import get_pool, pop_pools
+from contextlib import contextmanager
 import logging
 _logger = logging.getLogger(__name__)
 try:
@@ -29,7 +33,10 @@ class Webservice(models.Model):
 
     webservice_active = fields.Boolean(string='Webservice active')
     ws_url = fields.Char(string='Webservice URL')
-    ws_db = fields.Char(string='Webservice Database')
+    ws_db = fields.Char(
+        string='Webservice Database',
+        help="Name of the database. For SQLite the path of the file and"
+             " for CSV/Parquet files the path of the directory")
     ws_username = fields.Char(string='Webservice User')
     ws_password = fields.Char(string='Webservice Password')
     ws_type = fields.Selection(
@@ -38,6 +45,8 @@ class Webservice(models.Model):
             ('webservice.con.odoo', 'Odoo'),
             ('webservice.con.mysql', 'MySQL'),
             ('webservice.con.sqlserver', 'SQL Server'),
+            ('webservice.con.sqlite', 'SQLite'),
+            ('webservice.con.file', 'CSV/Parquet Files'),
         ])
 
     mapper_ids = fields.One2many(
@@ -47,29 +56,158 @@ class Webservice(models.Model):
         copy=True,
     )
     timeout = fields.Integer(string="Conection Timeout", default=300)
+    pool_size = fields.Integer(
+        string="Connexion Pool Size", default=4,
+        help="Maximum number of open connexions by each Odoo process")
+    pool_idle_timeout = fields.Integer(
+        string="Pool Idle Timeout", default=300,
+        help="Seconds after an unused connexion of the pool is closed")
 
-    connexion = []
+    odoo_protocol = fields.Selection(
+        string='Odoo Protocol',
+        selection=[('xmlrpc', 'XML-RPC'), ('jsonrpc', 'JSON-RPC')],
+        default='xmlrpc',
+        help="Protocol used to read from an Odoo source")
+    page_size = fields.Integer(
+        default=1000,
+        help="Records read on each request to an Odoo source")
+    fetch_workers = fields.Integer(
+        default=1,
+        help="Pages of an Odoo source, or reads of the dependences of a"
+             " batch, requested at the same time")
+
+    channel_id = fields.Many2one(
+        comodel_name='queue.job.channel',
+        help="Channel of the sync jobs of the mappers. Its capacity in the"
+             " queue_job configuration limits the jobs running at once")
+    max_shards = fields.Integer(
+        help="Maximum number of shards of each mapper of the instance, 0"
+             " means no limit. The jobs running at once are limited by the"
+             " capacity of the channel")
+    wave_poll_interval = fields.Integer(
+        default=60,
+        help="Seconds between the checks of the end of a wave of mappers")
+
+    _access_fields = ['ws_type', 'ws_url', 'ws_db', 'ws_username',
+                      'ws_password', 'timeout', 'odoo_protocol']
+
+    @api.multi
+    def write(self, vals):
+        res = super(Webservice, self).write(vals)
+        if any(f in vals for f in self._access_fields):
+            self.close_connexion()
+        return res
+
+    @api.multi
+    def unlink(self):
+        self.close_connexion()
+        return super(Webservice, self).unlink()
 
     def close_connexion(self):
-        if self.connexion:
-            self.connexion = self._get_connexion_obj().close_connexion(self.connexion)
+        """Closes the connexions pooled for the instances"""
+        for rec in self:
+            close = rec.ws_type and rec._get_connexion_obj().close_connexion
+            for pool in pop_pools((self.env.cr.dbname, rec.id)):
+                pool.close_all(close)
+
+    def _get_pool(self, **kargs):
+        con_obj = self._get_connexion_obj()
+        params = self._get_access_data()
+        key = (self.env.cr.dbname, self.id, self.ws_type,
+               bool(kargs.get('dictionary', True)))
+        pool, old_pool = get_pool(
+            key, tuple(sorted(params.items())),
+            max_size=self.pool_size or 1,
+            max_idle=self.pool_idle_timeout or 300,
+            timeout=self.timeout or 300)
+        if old_pool:
+            old_pool.close_all(con_obj.close_connexion)
+        return pool
+
+    @contextmanager
+    def get_connexion(self, **kargs):
+        """Gives a connexion of the pool of the instance while the
+        context is open"""
+        self.ensure_one()
+        con_obj = self._get_connexion_obj()
+        params = self._get_access_data()
+        pool = self._get_pool(**kargs)
+        conn = pool.acquire(
+            lambda: con_obj.connect(params, **kargs),
+            check=con_obj.is_alive, close=con_obj.close_connexion)
+        try:
+            yield conn
+        finally:
+            pool.release(conn, close=con_obj.close_connexion)
+
+    @contextmanager
+    def get_stream_connexion(self, **kargs):
+        """Gives a connexion out of the pool for a stream. The stream keeps
+        it until the generator is consumed, while the reads done meanwhile
+        by the same job take the connexions of the pool"""
+        self.ensure_one()
+        con_obj = self._get_connexion_obj()
+        conn = con_obj.connect(self._get_access_data(), **kargs)
+        try:
+            yield conn
+        finally:
+            con_obj.close_connexion(conn)
 
     def read_data(self, vals):
         ''''This function read data from db and return a dict'''
         con_obj = self._get_connexion_obj()
-        #Check if there is a connection already
-        self.connexion = self.connexion or con_obj.connect(self._get_access_data())
-        data = con_obj.read_data(self.connexion, vals)
-        return data
+        with self.get_connexion() as connexion:
+            return con_obj.read_data(
+                connexion, vals, **self._get_read_options())
+
+    def read_data_multi(self, vals_list):
+        """Returns the result of read_data for each vals of the list, the
+        connector can read them at the same time"""
+        if not vals_list:
+            return []
+        con_obj = self._get_connexion_obj()
+        with self.get_connexion() as connexion:
+            return con_obj.read_data_multi(
+                connexion, vals_list, **self._get_read_options())
+
+    def read_data_batches(self, vals, batch_size=1000):
+        """Generator that yields lists of rows read from the source.
+        It uses its own connexion, not taken from the pool"""
+        con_obj = self._get_connexion_obj()
+        with self.get_stream_connexion() as connexion:
+            for data in con_obj.read_data_batches(
+                    connexion, vals, batch_size=batch_size,
+                    **self._get_read_options()):
+                yield data
+
+    def read_column(self, vals, batch_size=1000):
+        """Generator that yields lists with the values of the first field.
+        It uses its own connexion, not taken from the pool"""
+        con_obj = self._get_connexion_obj()
+        with self.get_stream_connexion() as connexion:
+            for data in con_obj.read_column(
+                    connexion, vals, batch_size=batch_size,
+                    **self._get_read_options()):
+                yield data
+
+    def read_bounds(self, vals):
+        """Returns the minimum and maximum value of the first field"""
+        con_obj = self._get_connexion_obj()
+        with self.get_connexion() as connexion:
+            return con_obj.read_bounds(connexion, vals)
+
+    def _get_read_options(self):
+        """Options given to the connector when reading data"""
+        return {
+            'page_size': self.page_size,
+            'workers': self.fetch_workers or 1,
+        }
 
     def read_fields(self, table):
         "Reads the name of the columns of one table/model"
         con_obj = self._get_connexion_obj()
-        self.connexion = self.connexion or con_obj.connect(
-            self._get_access_data(), dictionary=False)
-        fields = con_obj.read_fields(self.connexion, table)
-        self.close_connexion()
-        return fields
+        with self.get_connexion(dictionary=False) as connexion:
+            return con_obj.read_fields(connexion, table)
 
     def _get_connexion_obj(self):
         """Returns the connector model and connexion objects if
@@ -87,7 +225,76 @@ class Webservice(models.Model):
             'user': self.ws_username,
             'password': self.ws_password,
             'timeout': self.timeout or 300,
+            'protocol': self.odoo_protocol or 'xmlrpc',
+        }
+
+    def _get_mapper_waves(self):
+        """Sorts the active mappers of the instance in waves, each wave
+        only depends on the mappers of the previous ones.
+        Returns a list of lists of mapper ids"""
+        self.ensure_one()
+        mappers = self.mapper_ids.filtered('active')
+        pending = {
+            mapper.id: set(
+                (mapper._get_dependence_mappers() & mappers).ids)
+            for mapper in mappers
         }
+        waves = []
+        while pending:
+            wave = sorted(
+                (m for m, deps in pending.items() if not deps),
+                key=lambda m: (mappers.browse(m).sequence, m))
+            if not wave:
+                raise UserError(
+                    _("There is a circular dependence between the "
+                      "mappers: %s") % ', '.join(
+                          mappers.browse(list(pending)).mapped('name')))
+            waves.append(wave)
+            for mapper_id in wave:
+                del pending[mapper_id]
+            for deps in pending.values():
+                deps.difference_update(wave)
+        return waves
+
+    def action_sync_waves(self):
+        """Syncs all the mappers of the instance, a wave of mappers
+        starts when all the jobs of the previous wave are done"""
+        for rec in self:
+            rec.with_delay(channel=rec.channel_id.complete_name or None
+                           ).sync_wave(rec._get_mapper_waves())
+        return {}
+
+    @job
+    def sync_wave(self, waves, index=0, job_uuids=None):
+        """Launch the jobs of the wave index when the jobs of the
+        previous wave (job_uuids) are finished"""
+        self.ensure_one()
+        if job_uuids:
+            jobs = self.env['queue.job'].sudo().search([
+                ('uuid', 'in', job_uuids)])
+            if jobs.filtered(lambda j: j.state not in ('done', 'failed')):
+                self.with_delay(
+                    channel=self.channel_id.complete_name or None,
+                    eta=datetime.now() + timedelta(
+                        seconds=self.wave_poll_interval)).sync_wave(
+                            waves, index, job_uuids)
+                return
+            failed = jobs.filtered(lambda j: j.state == 'failed')
+            if failed:
+                _logger.warning(
+                    'Wave %s of %s finished with %s failed jobs',
+                    index, self.name, len(failed))
+        if index >= len(waves):
+            return
+        mappers = self.env['webservice.mapper'].browse(waves[index])
+        # The mappers of the previous waves are already synced, so the
+        # related records are searched before syncing them again
+        job_uuids = mappers._enqueue_sync_jobs(lookup_dependences=index > 0)
+        self.with_delay(
+            channel=self.channel_id.complete_name or None,
+            eta=datetime.now() + timedelta(
+                seconds=self.wave_poll_interval)).sync_wave(
+                    waves, index + 1, job_uuids)
 
     def check_connection_webservice(self):
         """Check the connection"""
@@ -2,14 +2,28 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 from odoo import models, fields, api, _
 from odoo.addons.queue_job.job import job
+from odoo.addons.queue_job.exception import RetryableJobError
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
 from odoo.tools import pycompat
 from odoo.exceptions import ValidationError, UserError
+from psycopg2 import OperationalError
+from ..tools.sync_cache import SyncContext
+from ..tools.row_hash import row_hash
+from ..tools.plan import FieldPlan, MapperPlan, coerce_key
+from ..tools.profiler import SQLRecorder, profile_call
+from ..tools.diff_report import DiffReport
 import io
+import time
 import random
 import base64
+import marshal
 import logging
+import traceback
 _logger = logging.getLogger(__name__)
 
+# Types of the unique fields whose records are searched for a whole batch
+UNIQUE_TYPES = ('char', 'integer', 'many2one', 'selection')
+
 
 class WebserviceMapper(models.Model):
     _name = 'webservice.mapper'
@@ -76,6 +90,46 @@ class WebserviceMapper(models.Model):
     hide_create_unique_field = fields.Boolean()
     debug_mode = fields.Boolean(help=_("It will display technical information"
                                        " in the console"))
+    batch_size = fields.Integer(
+        default=100,
+        help="Number of source records synchronized by each queue job")
+    lazy_binary = fields.Boolean(
+        string="Read Binaries on Create",
+        help="The binary columns are only read from the source for the"
+             " records that don't exist yet, existing records don't"
+             " update their binary fields")
+    sync_run_ids = fields.One2many(
+        comodel_name='webservice.sync.run',
+        inverse_name='mapper_id',
+        readonly=True)
+    use_row_hash = fields.Boolean(
+        string="Skip Unchanged Records",
+        help="A hash of the source values of each record is stored when it"
+             " is synced, the records with the same hash are not written"
+             " again. It needs a search field")
+
+    ws_type = fields.Selection(related='webservice_id.ws_type')
+    watermark_field = fields.Char(
+        help="Source column that grows when a record changes (write date,"
+             " rowversion or id). When it is set only the records with a"
+             " value greater than the watermark value are synced")
+    watermark_type = fields.Selection(
+        selection=[('datetime', 'Date/Datetime'),
+                   ('integer', 'Integer'),
+                   ('rowversion', 'SQL Server Rowversion')],
+        default='datetime')
+    watermark_value = fields.Char(
+        copy=False,
+        help="Highest value of the watermark field synced. Empty it for"
+             " sync all the records again")
+    shard_count = fields.Integer(
+        default=1,
+        help="Number of jobs that sync at the same time ranges of the"
+             " unique source field. It must be numeric")
+    channel_id = fields.Many2one(
+        comodel_name='queue.job.channel',
+        help="Channel of the sync jobs, by default the one of the"
+             " instance")
 
     result = fields.Text(string='')
 
@@ -136,9 +190,9 @@ class WebserviceMapper(models.Model):
 
     @api.depends('odoo_model')
     def _compute_company_field(self):
+        metadata = self.env['webservice.metadata']
         for rec in self:
-            if rec.odoo_model.field_id.filtered(
-                    lambda o: o.name == 'company_id'):
+            if rec.odoo_model and metadata.has_company(rec.odoo_model.model):
                 rec.company_field = "company_id"
             else:
                 rec.company_field = ""
@@ -155,11 +209,9 @@ class WebserviceMapper(models.Model):
            the id of the source object
         """
         self.ensure_one()
-        field_obj = self.env['ir.model.fields']
-        field_obj = field_obj.search([
-            ('name', '=', 'x_old_id'),
-            ('model_id', '=', self.odoo_model.id),
-        ])
+        metadata = self.env['webservice.metadata']
+        field_obj = self.env['ir.model.fields'].browse(
+            metadata.get_field_id(self.odoo_model.model, 'x_old_id'))
         if not field_obj:
             field_obj = field_obj.sudo().create({
                 'name': 'x_old_id',
@@ -171,6 +223,7 @@ class WebserviceMapper(models.Model):
                 'index': True,
                 'state': 'manual'
             })
+            metadata.clear_caches()
         map_field_obj = self.env['webservice.mapper.fields']
         if not map_field_obj.search([
             ('webservice_mapper_id', '=', self.id),
@@ -236,18 +289,31 @@ class WebserviceMapper(models.Model):
         # self.check_dependences_fields()
         return self.is_valid_fields
 
-    # TODO check bug with infinite bucle
-    def check_dependences_fields(self):
+    def check_dependences_fields(self, visited=None):
+        """Checks the fields of the dependences recursively, visited
+        avoids looping over circular dependences"""
         self.ensure_one()
+        visited = set() if visited is None else visited
+        visited.add(self.id)
         all_valid = True
         for field_dep in self.mapper_fields_ids.filtered(
-                lambda x: x.dependence_id and not
-                x.dependence_id.is_valid_fields):
-            if not field_dep.dependence_id.check_mapped_fields():
+                lambda x: x.dependence_id and
+                x.dependence_id.id not in visited):
+            dependence = field_dep.dependence_id
+            if not dependence.check_mapped_fields() or \
+                    not dependence.check_dependences_fields(visited):
                 all_valid = False
-                field_dep.state_valid == "not_valid"
+                field_dep.state_valid = "not_valid"
         return all_valid
 
+    def _get_dependence_mappers(self):
+        """Mappers that must be synced before this one. The records of
+        one2many fields are owned by the parent and synced with it"""
+        self.ensure_one()
+        return self.mapper_fields_ids.filtered(
+            lambda x: x.dependence_id and x.field_type != 'one2many' and
+            x.create_method != 'together').mapped('dependence_id') - self
+
     def create_dependences(self):
         for rec in self:
             dep_list = rec.mapper_fields_ids.create_dependence()
@@ -260,8 +326,9 @@ class WebserviceMapper(models.Model):
                 raise UserError(_('You must select a Odoo Model'))
             current_fields = rec.mapper_fields_ids.mapped('odoo_field').mapped(
                 'name')
-            required_fields = rec.odoo_model.field_id.filtered(
-                lambda f: f.required and 'company_id' not in f.name)
+            required_fields = self.env['ir.model.fields'].browse(
+                self.env['webservice.metadata'].get_required_field_ids(
+                    rec.odoo_model.model))
             mapper_field_obj = self.env['webservice.mapper.fields']
             for field in required_fields:
                 if current_fields and field.name in current_fields:
@@ -277,10 +344,79 @@ class WebserviceMapper(models.Model):
                             self.mapper_fields_ids))
         res = {}
         for field in self.mapper_fields_ids:
-            field.source_field = field.source_field or field.odoo_field.name
-            res.update({field.source_field: field.odoo_field.name})
+            res.update({field.source_field or field.odoo_field.name:
+                        field.odoo_field.name})
         return res
 
+    def _get_plan(self):
+        """Returns the execution plan of the mapper, built once by run"""
+        plans = self._get_sync_context().plans
+        if self.id not in plans:
+            plans[self.id] = self._build_plan()
+        return plans[self.id]
+
+    def _build_plan(self):
+        self.ensure_one()
+        field_plans = []
+        for field in self.mapper_fields_ids:
+            field_plans.append(FieldPlan(
+                field_id=field.id,
+                source=field.source_field or field.odoo_field.name,
+                name=field.odoo_field.name,
+                ttype=field.odoo_field.ttype,
+                relation=field.odoo_relation or False,
+                is_x2many=field.odoo_field.ttype in [
+                    "one2many", "many2many"],
+                dependence_id=field.dependence_id.id,
+                unique=field.unique,
+                search_operator=field.search_operator,
+                create_method=field.create_method,
+                has_map=bool(field.map_values),
+            ))
+        search_field = self._get_search_field()
+        unique_source_field = self.unique_source_field or 'id'
+        key_info = search_field and self.env['webservice.metadata'].get_fields(
+            self.odoo_model.model).get(search_field)
+        # Without search field the existing records can't be known
+        # before reading the source
+        lazy_fields = tuple(f.source for f in field_plans
+                            if f.ttype == 'binary' and not f.unique)
+        if not self.lazy_binary or not search_field:
+            lazy_fields = ()
+        read_fields = [f.source for f in field_plans
+                       if f.source not in lazy_fields]
+        if lazy_fields and unique_source_field not in read_fields:
+            read_fields.append(unique_source_field)
+        return MapperPlan(
+            mapper_id=self.id,
+            model=self.odoo_model.model,
+            read_fields=tuple(read_fields),
+            lazy_fields=lazy_fields,
+            fields=tuple(f for f in field_plans if not f.relation),
+            relational=tuple(f for f in field_plans if f.relation),
+            before=tuple(f for f in field_plans
+                         if f.create_method == 'before'),
+            together=tuple(f for f in field_plans
+                           if f.create_method == 'together'),
+            after=tuple(f for f in field_plans
+                        if f.create_method == 'after'),
+            unique_fields=tuple(f for f in field_plans if f.unique),
+            binary_fields=tuple(f.name for f in field_plans
+                                if f.ttype == 'binary'),
+            search_field=search_field,
+            unique_source_field=unique_source_field,
+            company_field=self.company_field or False,
+            company_id=self.webservice_id.company_id.id,
+            company_domain=tuple(self.get_company_domain()),
+            update=self.update,
+            create_active=self.create_active,
+            method_calls=tuple(self.method_calls.split(';')
+                               if self.method_calls else []),
+            search_name='odoo' in (self.webservice_id.ws_type or ''),
+            use_row_hash=self.use_row_hash and bool(search_field),
+            key_type=key_info and key_info.ttype or False,
+        )
+
     def _get_search_domain(self):
         if self.search_domain:
             try:
@@ -291,23 +427,80 @@ class WebserviceMapper(models.Model):
                 raise ValidationError(_("Error Validating Search Domain"))
             return domain
 
-    def prepare_read_values(self, table, fields, domain):
+    def prepare_read_values(self, table, fields, domain, order=False):
         """This functions return a dict with the following keys
            table: str name of the table to search
            fields: list of the fields
            domain: domain written in source language
+           order: column used for sort the data
         """
         return {
             'table': table,
             'fields': fields,
-            'domain': domain
+            'domain': domain,
+            'order': order,
         }
 
+    def _get_watermark_domain(self):
+        """Domain for read only the records changed since the last sync"""
+        if not self.watermark_field or not self.watermark_value:
+            return []
+        if self.watermark_type == 'integer':
+            value = int(self.watermark_value)
+        elif self.watermark_type == 'rowversion':
+            value = bytes.fromhex(self.watermark_value)
+        else:
+            value = self.watermark_value
+        return [[self.watermark_field, '>', value]]
+
+    def _watermark_to_str(self, value):
+        if isinstance(value, bytes):
+            return value.hex()
+        return str(value)
+
+    def _watermark_key(self, value):
+        """Returns the watermark value in a comparable type"""
+        if self.watermark_type == 'integer':
+            return int(value)
+        if self.watermark_type == 'rowversion':
+            return int(value, 16)
+        return value
+
+    def _get_max_watermark(self, data_list):
+        values = [self._watermark_to_str(data[self.watermark_field])
+                  for data in data_list
+                  if data.get(self.watermark_field) is not None]
+        return values and max(values, key=self._watermark_key) or False
+
+    def _advance_watermark(self, value):
+        """Sets the watermark value if it is greater than the current one.
+        The row is locked so concurrent batches can't go backwards"""
+        if not value:
+            return
+        self.env.cr.execute("""SELECT watermark_value FROM webservice_mapper
+            WHERE id = %s FOR UPDATE""", (self.id,))
+        current = self.env.cr.fetchone()[0]
+        if current and \
+                self._watermark_key(current) >= self._watermark_key(value):
+            return
+        self.env.cr.execute("""UPDATE webservice_mapper
+            SET watermark_value = %s WHERE id = %s""", (value, self.id))
+        self.invalidate_cache(['watermark_value'], self.ids)
+
     def get_data_for_sync(self):
         """This function reads only the unique field from the source table,
-            then iterates from those unique fields in order to read
-            the rest of the mapped information one by one
+            then splits those unique values in chunks of batch_size and
+            creates one job per chunk that reads and writes the rest of
+            the mapped information
         """
+        self._enqueue_sync_jobs()
+        return {}
+
+    def _enqueue_sync_jobs(self, lookup_dependences=False):
+        """Creates the sync jobs of the mappers and returns their uuids.
+        lookup_dependences: the related records are searched before
+        syncing them, used when the dependences are already synced"""
+        job_uuids = []
         for rec in self.filtered('active'):
             if not rec.check_mapped_fields():
                 raise UserError(
@@ -318,15 +511,181 @@ class WebserviceMapper(models.Model):
             add_domain = rec._get_search_domain()
             if add_domain:
                 domain.append(add_domain)
-            # Only the unique field is readed
+            domain += rec._get_watermark_domain()
+            # Only the unique field is readed, and the watermark
+            # for incremental syncs
+            unique_field = rec.unique_source_field or 'id'
+            read_fields = [unique_field]
+            if rec.watermark_field:
+                read_fields.append(rec.watermark_field)
             read_vals = rec.prepare_read_values(
-                table=rec.source_model,
-                fields=[rec.unique_source_field or 'id'], domain=domain)
-            res_list = rec.webservice_id.read_data(read_vals)
-            for res in res_list:
-                rec.with_delay().sync_data(
-                    res[rec.unique_source_field or 'id'])
-        return {}
+                table=rec.source_model, fields=read_fields, domain=domain,
+                order=rec.watermark_field)
+            run = rec._create_sync_run(
+                lookup_dependences=lookup_dependences)
+            rec_uuids, skipped, watermark = [], 0, False
+            if rec._get_shard_count() > 1:
+                rec_uuids, watermark = rec._enqueue_shard_jobs(
+                    domain, lookup_dependences, run_id=run.id)
+            elif rec.watermark_field:
+                # The jobs end in any order, the watermark is advanced
+                # by the run when all of them are done
+                for res_list in rec.webservice_id.read_data_batches(
+                        read_vals, batch_size=max(rec.batch_size, 1)):
+                    marks = [watermark, rec._get_max_watermark(res_list)]
+                    watermark = max([x for x in marks if x],
+                                    key=rec._watermark_key, default=False)
+                    job = rec.with_delay(
+                        channel=rec._get_job_channel()).sync_data(
+                        rec._coerce_keys(
+                            [res[unique_field] for res in res_list]),
+                        lookup_dependences=lookup_dependences,
+                        run_id=run.id)
+                    rec_uuids.append(job.uuid)
+            else:
+                for keys in rec.webservice_id.read_column(
+                        read_vals, batch_size=max(rec.batch_size, 1)):
+                    keys = rec._coerce_keys(keys)
+                    new_keys = rec._filter_existing_keys(keys)
+                    skipped += len(keys) - len(new_keys)
+                    if not new_keys:
+                        continue
+                    job = rec.with_delay(
+                        channel=rec._get_job_channel()).sync_data(
+                        new_keys, lookup_dependences=lookup_dependences,
+                        run_id=run.id)
+                    rec_uuids.append(job.uuid)
+            run.write({
+                'jobs_pending': len(rec_uuids),
+                'watermark': watermark,
+                'records_skipped': skipped,
+                'state': 'running' if rec_uuids else 'done',
+            })
+            job_uuids += rec_uuids
+        return job_uuids
+
+    def _create_sync_run(self, jobs=0, lookup_dependences=False):
+        return self.env['webservice.sync.run'].sudo().create({
+            'name': self.name,
+            'mapper_id': self.id,
+            'jobs_pending': jobs,
+            'lookup_dependences': lookup_dependences,
+        })
+
+    def _filter_existing_keys(self, keys):
+        """Without update the source keys that already exist in the
+        current database are not synced again"""
+        if self.update or not self._get_plan().search_field:
+            return keys
+        found = self._index_odoo_records(self._search_odoo_records(keys))
+        return [key for key in keys if key not in found]
+
+    def _get_job_channel(self):
+        return self.channel_id.complete_name or \
+            self.webservice_id.channel_id.complete_name or None
+
+    def _get_shard_count(self):
+        """Shards of the mapper limited by the instance"""
+        shards = self.shard_count
+        if self.webservice_id.max_shards:
+            shards = min(shards, self.webservice_id.max_shards)
+        return max(shards, 1)
+
+    def _enqueue_shard_jobs(self, domain, lookup_dependences=False,
+                            run_id=False):
+        """Splits the range of the unique source field in shards and
+        creates one job for each one. Returns the uuids of the jobs and
+        the watermark reached when all of them are done"""
+        unique_field = self.unique_source_field or 'id'
+        instance = self.webservice_id
+        low, high = instance.read_bounds(self.prepare_read_values(
+            table=self.source_model, fields=[unique_field], domain=domain))
+        if low is None:
+            return [], False
+        if not isinstance(low, int) or not isinstance(high, int):
+            raise UserError(
+                _("The unique field of mapper %s must be numeric for "
+                  "sync it in shards") % self.name)
+        watermark = False
+        if self.watermark_field:
+            watermark = instance.read_bounds(self.prepare_read_values(
+                table=self.source_model, fields=[self.watermark_field],
+                domain=domain))[1]
+            watermark = watermark is not None and \
+                self._watermark_to_str(watermark)
+        shards = min(self._get_shard_count(), high - low + 1)
+        step = -(-(high - low + 1) // shards)
+        shard_obj = self.env['webservice.sync.run.shard'].sudo()
+        job_uuids = []
+        for start in range(low, high + 1, step):
+            shard = run_id and shard_obj.create({
+                'run_id': run_id,
+                'start': start,
+                'stop': start + step,
+            })
+            job = self.with_delay(
+                channel=self._get_job_channel()).sync_shard(
+                    start, start + step,
+                    lookup_dependences=lookup_dependences, run_id=run_id,
+                    shard_id=shard and shard.id)
+            job_uuids.append(job.uuid)
+        return job_uuids, watermark
+
+    @job
+    def sync_shard(self, start, stop, lookup_dependences=False,
+                   run_id=False, shard_id=False):
+        """Syncs the source records with a unique value in [start, stop).
+        Each batch is committed with the last key written in the shard,
+        a new job of the shard starts after that key. The run advances
+        the watermark when all its shards are done"""
+        self.ensure_one()
+        if lookup_dependences:
+            self = self.with_context(ws_lookup_dependences=True)
+        if run_id:
+            self = self.with_context(ws_run_id=run_id)
+        shard = self.env['webservice.sync.run.shard'].sudo().browse(
+            shard_id).exists()
+        if shard.state == 'done':
+            return
+        unique_field = self.unique_source_field or 'id'
+        read_vals = self._prepare_source_read_values()
+        read_vals['domain'] = read_vals['domain'] + [
+            [unique_field, '>=', start], [unique_field, '<', stop]]
+        if shard.last_key:
+            read_vals['domain'].append(
+                [unique_field, '>', int(shard.last_key)])
+        read_vals['order'] = unique_field
+        self._start_sync_stats(run_id)
+        data_list = []
+        try:
+            for data_list in self._timed_batches(
+                    self.webservice_id.read_data_batches(
+                        read_vals, batch_size=max(self.batch_size, 1))):
+                self._read_lazy_fields(data_list)
+                self._sync_rows(data_list)
+                self._flush_sync_stats(run_id)
+                if shard:
+                    shard.write({'last_key': str(max(
+                        int(data[unique_field]) for data in data_list))})
+                self.env.cr.commit()
+        except Exception as err:
+            self._fail_sync_run(run_id, len(data_list), err)
+            raise
+        if shard:
+            shard.write({'state': 'done'})
+        self._flush_sync_stats(run_id, jobs_done=1)
+
+    def _timed_batches(self, batches):
+        """Yields the batches of a generator counting the time spent
+        reading them"""
+        stats = self._get_sync_context().stats
+        while True:
+            with stats.timer('read'):
+                data_list = next(batches, None)
+            if data_list is None:
+                return
+            stats.count('read', len(data_list))
+            yield self._coerce_rows(data_list)
 
     @api.multi
     def action_sync_data(self):
@@ -335,23 +694,74 @@ class WebserviceMapper(models.Model):
                 raise UserError(
                     _("There are invalid fields for mapper %s,"
                         " check it out") % rec.name)
-            rec.sync_data()
+            # The run is committed apart, so it keeps the failure when
+            # the sync is rolled back
+            with self.pool.cursor() as cr:
+                run_id = rec.with_env(rec.env(cr=cr))._create_sync_run(
+                    jobs=1).id
+            rec.sync_data(run_id=run_id)
         return {}
 
     @job
-    def sync_data(self, res_id=False, odoo_rec=False, create_method='before'):
+    def sync_data(self, res_id=False, odoo_rec=False, create_method='before',
+                  lookup_dependences=False, run_id=False):
         """Writting data for %s""" % self.name
         """This functions controls the operations of reading and writting
         ---INPUTS---
         res_id: unique value of the source db
         odoo_rec: related record in Odoo DB
         created_method: param used in writting
+        lookup_dependences: search related records before syncing them
+        run_id: webservice.sync.run where the figures are added
         ---OUTPUTS---
         record_list: list of records in Odoo
         """
+        if run_id:
+            self = self.with_context(ws_run_id=run_id)
+        self._start_sync_stats(run_id)
+        try:
+            record_list = self._sync_data(
+                res_id, odoo_rec, create_method, lookup_dependences)
+        except Exception as err:
+            self._fail_sync_run(
+                run_id, len(res_id) if type(res_id) is list else 1, err)
+            raise
+        self._flush_sync_stats(run_id, jobs_done=1)
+        return record_list
+
+    def _start_sync_stats(self, run_id):
+        if run_id:
+            self._get_sync_context().stats.reset()
+
+    def _flush_sync_stats(self, run_id, jobs_done=0):
+        """Adds the figures collected since the last flush to the run,
+        they are written when the transaction is committed"""
+        if not run_id:
+            return
+        stats = self._get_sync_context().stats
+        run = self.env['webservice.sync.run'].sudo().browse(run_id).exists()
+        if run:
+            run.add_stats(stats, jobs_done)
+        stats.reset()
+
+    def _fail_sync_run(self, run_id, count, error=None):
+        """Counts the records of a failed job. The jobs that fail by a
+        concurrent update are tried again by the queue"""
+        if not run_id or isinstance(error, RetryableJobError) or \
+                isinstance(error, OperationalError) and \
+                error.pgcode in PG_CONCURRENCY_ERRORS_TO_RETRY:
+            return
+        run = self.env['webservice.sync.run'].sudo().browse(run_id).exists()
+        if run:
+            run.add_failure(count)
+
+    def _sync_data(self, res_id=False, odoo_rec=False, create_method='before',
+                   lookup_dependences=False):
         self.ensure_one()
         if not self.active:
             return
+        if lookup_dependences:
+            self = self.with_context(ws_lookup_dependences=True)
         record_list = []
         # If we don't pass the res_id it is get from sync_ids field
         if not res_id:
@@ -361,21 +771,408 @@ class WebserviceMapper(models.Model):
                     res_id = False
             except Exception:
                 res_id = False
+        plan = self._get_plan()
+        unique_field = plan.unique_source_field
+        # Without ids and record the whole source is synced
+        # reading it in batches
+        if not res_id and not odoo_rec:
+            for data_list in self.read_data_batches():
+                record_list += self._sync_rows(data_list, create_method)
+                if self.watermark_field:
+                    self._advance_watermark(
+                        self._get_max_watermark(data_list))
+            return record_list
+        # Records already synced in this run are not read again
+        if res_id and not odoo_rec and create_method != 'together':
+            synced_recs, res_id = self._get_synced_records(res_id)
+            record_list += synced_recs
+            if not res_id:
+                return record_list
         # Reading Data
         data_list, odoo_rec = self.read_data(res_id, odoo_rec)
+        # When a batch of ids is synced each source row is written
+        # over its own record
+        is_batch = type(res_id) is list and len(res_id) > 1
+        rec_index = self._index_odoo_records(odoo_rec) if is_batch else {}
         # If the record already exits and don't want to update
-        if odoo_rec and not data_list:
-            odoo_rec = odoo_rec if type(odoo_rec) is list else [odoo_rec]
+        if odoo_rec and (not data_list or (is_batch and not plan.update)):
+            self._get_sync_context().stats.count('skipped', len(odoo_rec))
+            for key, rec in self._index_odoo_records(odoo_rec).items():
+                self._set_synced(key, rec)
             for rec in odoo_rec:
                 record_list.append(rec)
         # Write the data. If data_list is empty its means update == False
         # or the source db is empty
-        for data in data_list:
-            rec_id = self.write_data(data, odoo_rec, create_method)
+        keys = [data.get(unique_field) for data in data_list]
+        hashes = {}
+        if is_batch:
+            if plan.use_row_hash and create_method != 'together':
+                keys, data_list, hashes, unchanged = \
+                    self._filter_unchanged_rows(keys, data_list, rec_index)
+                record_list += unchanged
+            self._preload_dependences(data_list)
+            self._prefetch_dependences(data_list)
+        rows = [(data, rec_index.get(key, False) if is_batch else odoo_rec)
+                for key, data in zip(keys, data_list)]
+        results = self._write_batch_safe(
+            keys, rows, create_method, dependences=is_batch)
+        for key, rec_id in zip(keys, results):
+            if rec_id:
+                self._set_synced(key, rec_id)
+                record_list.append(rec_id)
+        self._store_row_hashes(keys, results, hashes)
+        return record_list
+
+    def _sync_rows(self, data_list, create_method='before'):
+        """Writes a batch of source rows read with all the mapped fields
+        and returns the records"""
+        plan = self._get_plan()
+        keys = [data.get(plan.unique_source_field) for data in data_list]
+        rec_index, hashes, record_list = {}, {}, []
+        if plan.search_field:
+            rec_index = self._index_odoo_records(self._search_odoo_records(
+                [key for key in keys if key is not None]))
+        if not plan.update and rec_index:
+            # Without update the existing records are not written
+            rows = []
+            for key, data in zip(keys, data_list):
+                if key in rec_index:
+                    self._set_synced(key, rec_index[key])
+                    record_list.append(rec_index[key])
+                else:
+                    rows.append((key, data))
+            self._get_sync_context().stats.count(
+                'skipped', len(keys) - len(rows))
+            keys = [key for key, data in rows]
+            data_list = [data for key, data in rows]
+        if plan.use_row_hash and create_method != 'together':
+            keys, data_list, hashes, unchanged = \
+                self._filter_unchanged_rows(keys, data_list, rec_index)
+            record_list += unchanged
+        self._preload_dependences(data_list)
+        self._prefetch_dependences(data_list)
+        results = self._write_batch_safe(
+            keys, [(data, rec_index.get(key, False))
+                   for key, data in zip(keys, data_list)], create_method,
+            dependences=True)
+        for key, rec_id in zip(keys, results):
             if rec_id:
+                self._set_synced(key, rec_id)
                 record_list.append(rec_id)
+        self._store_row_hashes(keys, results, hashes)
         return record_list
 
+    def _filter_unchanged_rows(self, keys, data_list, rec_index):
+        """Compares the hash of the rows with the stored one. Returns the
+        keys, rows and hashes of the rows that must be written and the
+        records of the unchanged rows"""
+        plan = self._get_plan()
+        stored = self.env['webservice.sync.hash'].get_hashes(
+            self.id, [key for key in keys if key in rec_index])
+        changed_keys, changed_rows, hashes, unchanged = [], [], {}, []
+        for key, data in zip(keys, data_list):
+            if key is None:
+                changed_keys.append(key)
+                changed_rows.append(data)
+                continue
+            value = row_hash(data, plan.read_fields)
+            if key in rec_index and stored.get(str(key)) == value:
+                self._set_synced(key, rec_index[key])
+                unchanged.append(rec_index[key])
+                continue
+            hashes[key] = value
+            changed_keys.append(key)
+            changed_rows.append(data)
+        self._get_sync_context().stats.count('skipped', len(unchanged))
+        return changed_keys, changed_rows, hashes, unchanged
+
+    def _store_row_hashes(self, keys, results, hashes):
+        """Stores the hashes of the rows written over a record"""
+        if not hashes:
+            return
+        self.env['webservice.sync.hash'].set_hashes(self.id, {
+            key: hashes[key] for key, rec_id in zip(keys, results)
+            if key in hashes and isinstance(rec_id, models.BaseModel)})
+
+    def action_reset_row_hash(self):
+        """All the records will be written on the next sync"""
+        self.env['webservice.sync.hash'].clear_hashes(self.ids)
+        return {}
+
+    def _get_sync_context(self):
+        """Returns the caches of the sync run of the current transaction.
+        They are dropped when the transaction is rolled back"""
+        cr = self.env.cr
+        if 'webservice_sync' not in cr.cache:
+            size = self.env['ir.config_parameter'].sudo().get_param(
+                'webservice_integration.cache_size', '100000')
+            cr.cache['webservice_sync'] = SyncContext(int(size))
+
+            def clear_on_rollback():
+                # Handlers are removed after each commit or rollback
+                cr.after('rollback',
+                         lambda: cr.cache.pop('webservice_sync', None))
+                cr.after('commit', clear_on_rollback)
+            clear_on_rollback()
+        return cr.cache['webservice_sync']
+
+    def _set_synced(self, key, rec):
+        """Stores the odoo record of a source key synced in this run"""
+        if key is None or not isinstance(rec, models.BaseModel):
+            return
+        sync_ctx = self._get_sync_context()
+        sync_ctx.synced[(self.id, key)] = rec.id
+        plan = self._get_plan()
+        if plan.search_field:
+            sync_ctx.xref[(plan.model, plan.search_field, key)] = rec.id
+
+    def _get_synced_records(self, res_id):
+        """Returns the records already synced in the run and the
+        source keys that still must be synced"""
+        synced = self._get_sync_context().synced
+        model_obj = self.env[self._get_plan().model].sudo()
+        keys = res_id if type(res_id) is list else [res_id]
+        records, pending = [], []
+        for key in keys:
+            odoo_id = synced.get((self.id, key))
+            if odoo_id:
+                records.append(model_obj.browse(odoo_id))
+            else:
+                pending.append(key)
+        if type(res_id) is not list:
+            pending = pending and pending[0]
+        return records, pending
+
+    def _preload_dependences(self, data_list):
+        """Resolves with one search per related model the relations
+        of a batch of source rows, the rows will find them in the cache"""
+        with self._get_sync_context().stats.timer('dependence'):
+            self._search_dependences(data_list)
+
+    def _prefetch_dependences(self, data_list):
+        """Reads from the source the rows of the related records that will
+        be synced with the batch, with one read per dependence mapper. The
+        reads of all the mappers are sent at the same time and repeated
+        for the dependences of the rows read"""
+        with self._get_sync_context().stats.timer('dependence'):
+            pending = self._collect_prefetch_keys(data_list, {})
+            while pending:
+                mappers = self.browse(list(pending))
+                results = self.webservice_id.read_data_multi([
+                    mapper._prepare_prefetch_read_values(pending[mapper.id])
+                    for mapper in mappers])
+                pending = {}
+                for mapper, rows in zip(mappers, results):
+                    mapper._store_prefetched_rows(rows)
+                    mapper._collect_prefetch_keys(rows, pending)
+
+    def _sync_dependences(self, data_list):
+        """Syncs with one sync_data by dependence mapper the related
+        records of the batch that are created before the parents, so the
+        rows only find them in the sync context. The x2many records
+        created together with the parent are left to each row"""
+        sync_ctx = self._get_sync_context()
+        lookup = self.env.context.get('ws_lookup_dependences')
+        pending = {}
+        for fp in self._get_plan().relational:
+            if not fp.dependence_id or fp.is_x2many and (
+                    fp.ttype == 'one2many' or
+                    fp.create_method == 'together'):
+                continue
+            dep_mapper = self.browse(fp.dependence_id)
+            if not dep_mapper.active:
+                continue
+            dep_plan = dep_mapper._get_plan()
+            keys = pending.setdefault(dep_mapper.id, [])
+            for data in data_list:
+                value = data.get(fp.source)
+                if not value:
+                    continue
+                if not fp.is_x2many:
+                    value = [value[0] if type(value) in (list, tuple)
+                             else value]
+                for key in value:
+                    if (dep_mapper.id, key) in sync_ctx.synced or \
+                            (dep_mapper.id, key) in sync_ctx.syncing or \
+                            lookup and dep_plan.search_field and (
+                                dep_plan.model, dep_plan.search_field,
+                                key) in sync_ctx.xref:
+                        continue
+                    keys.append(key)
+        for dep_id, keys in pending.items():
+            # Same key in several rows and fields
+            keys = list(dict.fromkeys(keys))
+            if not keys:
+                continue
+            sync_ctx.syncing.update((dep_id, key) for key in keys)
+            try:
+                with sync_ctx.stats.timer('dependence'):
+                    self.browse(dep_id).sync_data(res_id=keys)
+            finally:
+                sync_ctx.syncing.difference_update(
+                    (dep_id, key) for key in keys)
+
+    def _collect_prefetch_keys(self, data_list, pending):
+        """Adds to pending {mapper id: set of keys} the related keys of
+        the rows whose source row must be read"""
+        for fp in self._get_plan().relational:
+            if not fp.dependence_id:
+                continue
+            dep_mapper = self.browse(fp.dependence_id)
+            if not dep_mapper.active or \
+                    dep_mapper.webservice_id != self.webservice_id:
+                continue
+            for data in data_list:
+                value = data.get(fp.source)
+                if not value:
+                    continue
+                if fp.is_x2many:
+                    keys = value
+                else:
+                    keys = [value[0] if type(value) in (list, tuple)
+                            else value]
+                for key in keys:
+                    if dep_mapper._must_read_row(key):
+                        pending.setdefault(dep_mapper.id, set()).add(key)
+        return pending
+
+    def _must_read_row(self, key):
+        """The source row of the key isn't synced, prefetched or found
+        in the current database when it doesn't need to be updated"""
+        sync_ctx = self._get_sync_context()
+        if (self.id, key) in sync_ctx.synced or \
+                (self.id, key) in sync_ctx.rows:
+            return False
+        plan = self._get_plan()
+        lookup = not plan.update or \
+            self.env.context.get('ws_lookup_dependences')
+        return not (lookup and plan.search_field and (
+            plan.model, plan.search_field, key) in sync_ctx.xref)
+
+    def _prepare_prefetch_read_values(self, keys):
+        unique_field = self._get_plan().unique_source_field
+        return self.prepare_read_values(
+            table=self.source_model,
+            fields=list(self._get_plan().read_fields),
+            domain=[(unique_field, 'in', list(keys))])
+
+    def _store_prefetched_rows(self, rows):
+        sync_ctx = self._get_sync_context()
+        unique_field = self._get_plan().unique_source_field
+        for row in self._coerce_rows(rows):
+            sync_ctx.rows[(self.id, row.get(unique_field))] = row
+
+    def _pop_prefetched_rows(self, res_id):
+        """Returns the prefetched rows of the keys and the keys that must
+        still be read, False when all of them were prefetched"""
+        rows = self._get_sync_context().rows
+        keys = res_id if type(res_id) is list else [res_id]
+        prefetched, pending = [], []
+        for key in keys:
+            row = rows.pop((self.id, key), None)
+            if row is None:
+                pending.append(key)
+            else:
+                # The row is written by the sync, it is copied
+                prefetched.append(dict(row))
+        if type(res_id) is not list:
+            return prefetched, pending[0] if pending else False
+        return prefetched, pending or False
+
+    def _search_dependences(self, data_list):
+        for fp in self._get_plan().relational:
+            values = set()
+            for data in data_list:
+                value = data.get(fp.source)
+                if not value:
+                    continue
+                if fp.is_x2many:
+                    values.update(value)
+                else:
+                    # many2one values are (id, 'display_name') in odoo
+                    values.add(value[0] if type(value) in (list, tuple)
+                               else value)
+            if not values:
+                continue
+            if fp.dependence_id:
+                dep_mapper = self.browse(fp.dependence_id)
+                if dep_mapper._get_plan().search_field:
+                    dep_mapper._search_odoo_records(list(values))
+            else:
+                model_obj = self.env[fp.relation]
+                if 'x_old_id' in model_obj._fields:
+                    self.env['webservice.mapper.fields'].browse(
+                        fp.field_id)._search_old_ids(
+                            model_obj, list(values))
+
+    def _search_odoo_records(self, res_id):
+        """Search the records of the current database for the source keys.
+        The keys resolved in the run are not searched again"""
+        plan = self._get_plan()
+        search_field = plan.search_field
+        model_obj = self.env[plan.model].sudo()
+        xref = self._get_sync_context().xref
+        odoo_ids, missing = [], []
+        for key in res_id if type(res_id) is list else [res_id]:
+            odoo_id = xref.get((plan.model, search_field, key))
+            if odoo_id:
+                odoo_ids.append(odoo_id)
+            else:
+                missing.append(key)
+        if missing:
+            op = 'in' if len(missing) > 1 else '='
+            value = missing if op == 'in' else missing[0]
+            found = model_obj.search([(search_field, op, value)])
+            for key, rec in self._index_odoo_records(found).items():
+                xref[(plan.model, search_field, key)] = rec.id
+            odoo_ids += found.ids
+        return model_obj.browse(odoo_ids)
+
+    def _coerce_keys(self, keys):
+        """Source keys in the type of the search field"""
+        key_type = self._get_plan().key_type
+        return [coerce_key(key, key_type) for key in keys]
+
+    def _coerce_rows(self, data_list):
+        """Converts the keys of the rows read as text to the type of the
+        search field of their mapper, the key of the row and the keys of
+        the dependences. The rows are changed and returned"""
+        plan = self._get_plan()
+        columns = [(plan.unique_source_field, plan.key_type)]
+        for fp in plan.relational:
+            if fp.dependence_id:
+                columns.append((fp.source, self.browse(
+                    fp.dependence_id)._get_plan().key_type))
+        columns = [(name, ttype) for name, ttype in columns if ttype]
+        for data in data_list if columns else []:
+            for name, ttype in columns:
+                value = data.get(name)
+                if type(value) is list:
+                    data[name] = [coerce_key(x, ttype) for x in value]
+                elif value is not None:
+                    data[name] = coerce_key(value, ttype)
+        return data_list
+
+    def _get_search_field(self):
+        """Returns the field used for search the source records in the
+        current database"""
+        model_obj = self.env[self.odoo_model.model]
+        return self.search_field or 'x_old_id' in \
+            model_obj._fields and 'x_old_id'
+
+    def _index_odoo_records(self, odoo_rec):
+        """Returns a dict with k=search field value and v=odoo record"""
+        search_field = self._get_plan().search_field
+        if not odoo_rec or not search_field:
+            return {}
+        res = {}
+        for rec in odoo_rec:
+            value = rec[search_field]
+            if isinstance(value, models.BaseModel):
+                value = value.id
+            res[value] = rec
+        return res
+
     def read_data(self, res_id=False, odoo_rec=False):
         """This function read the mapped data from source database search if
         the record already exists in the current database:
@@ -390,35 +1187,304 @@ class WebserviceMapper(models.Model):
         if odoo_rec and not self.update:
             return [], odoo_rec
         # Init Variables
-        domain, op = [], "="
-        # Get odoo model
-        model_obj = self.env[self.odoo_model.model].sudo()
+        domain, op, prefetched = [], "=", []
         # Reading in current databases
         # If res_id is set search this record in current odoo  and source odoo
         if res_id:
             res_id = res_id[0] if type(res_id) is list and len(
                 res_id) == 1 else res_id
-            search_field = self.search_field or 'x_old_id' in \
-                model_obj._fields and 'x_old_id'
+            op = 'in' if type(res_id) is list else '='
+            search_field = self._get_plan().search_field
             if not odoo_rec and search_field:
                 # Set Domain for Current Odoo DB
-                domain += self.get_company_domain()
-                op = 'in' if type(res_id) is list else '='
-                domain = [(search_field, op, res_id)]
-                odoo_rec = model_obj.search(domain)
+                odoo_rec = self._search_odoo_records(res_id)
                 if odoo_rec and not self.update:
-                    return [], odoo_rec
+                    if op == '=':
+                        return [], odoo_rec
+                    # Only read from the source the records of the batch
+                    # that doesn't exist yet
+                    found = self._index_odoo_records(odoo_rec)
+                    res_id = [x for x in res_id if x not in found]
+                    if not res_id:
+                        return [], odoo_rec
+            # The rows prefetched with the parent batch are not read again
+            prefetched, res_id = self._pop_prefetched_rows(res_id)
+            op = 'in' if type(res_id) is list else '='
             # Set Domain for Source Odoo DB
-            domain = [(self.unique_source_field or 'id', op, res_id)]
+            domain = res_id and [
+                (self.unique_source_field or 'id', op, res_id)]
         elif self.search_domain:
             domain = eval(self.search_domain)
-        read_fields = self.get_mapped_fields(for_search=True)
-        read_vals = self.prepare_read_values(
-            table=self.source_model, fields=read_fields, domain=domain)
-        data_list = self.webservice_id.read_data(read_vals)
-        self.result = '--DATA READ--\n %s' % str(data_list)
+        stats = self._get_sync_context().stats
+        data_list = []
+        if domain is not False:
+            read_fields = list(self._get_plan().read_fields)
+            read_vals = self.prepare_read_values(
+                table=self.source_model, fields=read_fields, domain=domain)
+            with stats.timer('read'):
+                data_list = self.webservice_id.read_data(read_vals)
+            stats.count('read', len(data_list))
+        data_list = prefetched + self._coerce_rows(data_list)
+        self._read_lazy_fields(data_list)
+        if self.debug_mode:
+            self.result = '--DATA READ--\n %s' % str(data_list)
         return data_list, odoo_rec
 
+    def _read_lazy_fields(self, data_list):
+        """Reads the lazy columns of the rows that don't have a record
+        in the current database yet and adds them to the rows"""
+        plan = self._get_plan()
+        if not plan.lazy_fields or not data_list:
+            return
+        unique_field = plan.unique_source_field
+        keys = [data.get(unique_field) for data in data_list]
+        found = self._index_odoo_records(self._search_odoo_records(
+            [key for key in keys if key is not None]))
+        missing = [key for key in keys
+                   if key is not None and key not in found]
+        if not missing:
+            return
+        op = 'in' if len(missing) > 1 else '='
+        read_vals = self.prepare_read_values(
+            table=self.source_model,
+            fields=[unique_field] + list(plan.lazy_fields),
+            domain=[(unique_field, op,
+                     missing if op == 'in' else missing[0])])
+        with self._get_sync_context().stats.timer('read'):
+            lazy_rows = {
+                coerce_key(row[unique_field], plan.key_type): row
+                for row in self.webservice_id.read_data(read_vals)}
+        for key, data in zip(keys, data_list):
+            row = lazy_rows.get(key)
+            if row:
+                data.update({f: row.get(f) for f in plan.lazy_fields})
+
+    def _prepare_source_read_values(self):
+        """Read values of all the mapped fields filtered by the
+        search domain and the watermark"""
+        domain = []
+        if self.search_domain:
+            domain = eval(self.search_domain)
+        domain = domain + self._get_watermark_domain()
+        read_fields = list(self._get_plan().read_fields)
+        if self.watermark_field and self.watermark_field not in read_fields:
+            read_fields.append(self.watermark_field)
+        return self.prepare_read_values(
+            table=self.source_model, fields=read_fields, domain=domain,
+            order=self.watermark_field)
+
+    def read_data_batches(self):
+        """Generator that yields lists of batch_size dicts read from the
+        source database filtered by the search domain"""
+        self.ensure_one()
+        read_vals = self._prepare_source_read_values()
+        for data_list in self._timed_batches(
+                self.webservice_id.read_data_batches(
+                    read_vals, batch_size=max(self.batch_size, 1))):
+            self._read_lazy_fields(data_list)
+            if self.debug_mode:
+                self.result = '--DATA READ--\n %s' % str(data_list)
+            yield data_list
+
+    def action_profile_sync(self, sql_limit=20):
+        """Syncs a sample of records under the profiler counting the time
+        of the SQL queries. The report is attached to the mapper"""
+        self.ensure_one()
+        res_id = self._get_profile_sample()
+        if not res_id:
+            raise UserError(_("There are no source records to profile"))
+        recorder = SQLRecorder()
+        start = time.time()
+        with recorder.record(self.env.cr):
+            records, profiler, profile = profile_call(
+                self.sync_data, res_id=res_id)
+        elapsed = time.time() - start
+        report = '\n'.join([
+            '--PROFILE OF %s--' % self.name,
+            'Source keys: %s' % res_id,
+            '%s records synced in %.3f s' % (len(records or []), elapsed),
+            '', '--SQL--', recorder.report(sql_limit),
+            '', '--PYTHON--', profile])
+        name = 'profile_%s_%s' % (self.name, time.strftime('%Y%m%d%H%M%S'))
+        attachment_obj = self.env['ir.attachment']
+        # The raw stats can be opened with pstats or snakeviz
+        attachment_obj.create({
+            'name': name + '.prof',
+            'datas_fname': name + '.prof',
+            'datas': base64.b64encode(marshal.dumps(profiler.stats)),
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        attachment = attachment_obj.create({
+            'name': name + '.txt',
+            'datas_fname': name + '.txt',
+            'datas': base64.b64encode(report.encode()),
+            'mimetype': 'text/plain',
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % attachment.id,
+            'target': 'self',
+        }
+
+    def _get_profile_sample(self):
+        """Source keys of sync_ids or the first batch of the source"""
+        try:
+            res_id = eval(self.sync_ids or 'False')
+        except Exception:
+            res_id = False
+        if type(res_id) in (int, list) and res_id:
+            return res_id
+        unique_field = self.unique_source_field or 'id'
+        read_vals = self._prepare_source_read_values()
+        read_vals.update(fields=[unique_field], order=False)
+        batches = self.webservice_id.read_column(
+            read_vals, batch_size=max(self.batch_size, 1))
+        try:
+            return self._coerce_keys(next(batches, []))
+        finally:
+            batches.close()
+
+    @api.multi
+    def action_dry_run(self):
+        for rec in self:
+            rec.with_delay(channel=rec._get_job_channel()).dry_run()
+        return {}
+
+    @job
+    def dry_run(self, sample_size=100):
+        """Compares the source with the current database without writing
+        it. The dependences are only searched and the rows are compared
+        batch by batch, the report with the counters and a sample of the
+        changes is attached to the mapper"""
+        self.ensure_one()
+        self = self.with_context(ws_dry_run=True)
+        report = DiffReport(sample_size)
+        read_vals = self._prepare_source_read_values()
+        for data_list in self._timed_batches(
+                self.webservice_id.read_data_batches(
+                    read_vals, batch_size=max(self.batch_size, 1))):
+            self._dry_run_batch(data_list, report)
+            # Only the report is kept between batches
+            self.env.clear()
+        name = 'dry_run_%s_%s' % (self.name, time.strftime('%Y%m%d%H%M%S'))
+        self.env['ir.attachment'].create({
+            'name': name + '.txt',
+            'datas_fname': name + '.txt',
+            'datas': base64.b64encode(report.to_text(self.name).encode()),
+            'mimetype': 'text/plain',
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        return ', '.join('%s: %s' % x for x in sorted(report.counts.items()))
+
+    def _dry_run_batch(self, data_list, report):
+        """Adds to the report the rows of the batch. The records of the
+        batch are read together when they are compared"""
+        plan = self._get_plan()
+        model_obj = self.env[plan.model].sudo()
+        keys = [data.get(plan.unique_source_field) for data in data_list]
+        rec_index = {}
+        if plan.search_field:
+            rec_index = self._index_odoo_records(self._search_odoo_records(
+                [key for key in keys if key is not None]))
+        transformed = self._transform_columns(data_list)
+        rows = []
+        for i, (key, data) in enumerate(zip(keys, data_list)):
+            try:
+                data_write, data_write_after, domain = \
+                    self._prepare_write_data(data, {
+                        k: v[i] for k, v in transformed.items()})
+                odoo_rec = rec_index.get(key) or domain and \
+                    model_obj.search(domain, limit=1)
+            except Exception as err:
+                report.add('error', key, {'error': (None, str(err))})
+                continue
+            rows.append((key, odoo_rec and odoo_rec.id,
+                         dict(data_write, **data_write_after)))
+        targets = {rec.id: rec for rec in model_obj.browse(
+            list({odoo_id for key, odoo_id, values in rows if odoo_id}))}
+        for key, odoo_id, values in rows:
+            if not odoo_id:
+                report.add('create' if plan.create_active else 'skipped',
+                           key, {name: (None, value)
+                                 for name, value in values.items()})
+            elif not plan.update:
+                report.add('skipped', key)
+            else:
+                diffs = self._diff_record(targets[odoo_id], values)
+                report.add('update' if diffs else 'unchanged', key, diffs)
+
+    def _diff_record(self, record, values):
+        """Returns {field: (current value, new value)} of the values that
+        change the record. Binary fields are not compared"""
+        diffs = {}
+        for name, value in values.items():
+            field = record._fields.get(name)
+            if not field or field.type == 'binary':
+                continue
+            if field.type in ('one2many', 'many2many'):
+                old = sorted(record[name].ids)
+                value = value or []
+                if all(cmd[0] == 6 for cmd in value):
+                    new = sorted({x for cmd in value for x in cmd[2]})
+                else:
+                    # New lines of the record always change it
+                    new = value
+            else:
+                old = field.convert_to_write(record[name], record)
+                try:
+                    new = field.convert_to_write(field.convert_to_record(
+                        field.convert_to_cache(value, record, validate=False),
+                        record), record)
+                except Exception:
+                    new = value
+            if old != new:
+                diffs[name] = (old, new)
+        return diffs
+
+    def action_benchmark_transport(self, limit=10000):
+        """Reads up to limit records of the source with XML-RPC and
+        JSON-RPC and writes the time and bytes received in result. The
+        pages are read in one thread"""
+        self.ensure_one()
+        instance = self.webservice_id
+        if instance.ws_type != 'webservice.con.odoo':
+            raise UserError(
+                _("The transport benchmark is only for Odoo sources"))
+        con_obj = instance._get_connexion_obj()
+        read_vals = self._prepare_source_read_values()
+        # The proxies of the fetch workers don't count the bytes, all
+        # the pages are read with the counting proxy
+        options = dict(instance._get_read_options(), workers=1)
+        report = ['--TRANSPORT BENCHMARK--']
+        for protocol in ['xmlrpc', 'jsonrpc']:
+            params = dict(instance._get_access_data(), protocol=protocol)
+            conn = con_obj.connect(params, count_bytes=True)
+            records, start = 0, time.time()
+            try:
+                for data_list in con_obj.read_data_batches(
+                        conn, read_vals, batch_size=options['page_size'],
+                        **options):
+                    records += len(data_list)
+                    if records >= limit:
+                        break
+                elapsed = time.time() - start
+                if protocol == 'jsonrpc':
+                    received = conn[0].bytes_received
+                else:
+                    received = conn[0]('transport').bytes_received
+            finally:
+                con_obj.close_connexion(conn)
+            report.append(
+                '%s: %s records in %.2f s (%.0f rec/s), %.0f KB received'
+                % (protocol, records, elapsed,
+                   records / elapsed if elapsed else 0, received / 1024.0))
+        self.result = '\n'.join(report)
+        return {}
+
     def write_data(self, data_read, odoo_rec=False, create_method='before'):
         """This function write data for the model and return the record
             res_id = id in source, odoo_rec = rec in current odoo
@@ -430,144 +1496,348 @@ class WebserviceMapper(models.Model):
         """
         if not data_read:
             return False
+        return self.write_batch([(data_read, odoo_rec)], create_method)[0]
+
+    def _write_batch_safe(self, keys, rows, create_method='before',
+                          dependences=False):
+        """Writes the batch in a savepoint. When it fails each row is
+        written in its own savepoint and the rows that fail are stored
+        as sync errors, the rest of the batch is kept.
+        dependences: the dependences of the batch are synced in the same
+        savepoint. When one of them fails each row syncs its own ones, so
+        their errors are stored with the key of the parent"""
+        sync_ctx = self._get_sync_context()
+        data_list = [data for data, rec in rows] if dependences else []
+        if sync_ctx.stats.nested:
+            self._sync_dependences(data_list)
+            return self.write_batch(rows, create_method)
+        copies = [(dict(data) if data else data, rec)
+                  for data, rec in rows]
+        counts = dict(sync_ctx.stats.counts)
+        try:
+            with self.env.cr.savepoint():
+                self._sync_dependences(data_list)
+                return self.write_batch(rows, create_method)
+        except Exception:
+            _logger.info('Batch of mapper %s failed, writing it by row',
+                         self.name, exc_info=True)
+        # The records written in the savepoint don't exist anymore
+        sync_ctx.clear_records()
+        sync_ctx.stats.counts.clear()
+        sync_ctx.stats.counts.update(counts)
+        self.env.clear()
+        error_obj = self.env['webservice.sync.error']
+        run_id = self.env.context.get('ws_run_id', False)
+        results = []
+        for key, (data, rec) in zip(keys, copies):
+            try:
+                with self.env.cr.savepoint():
+                    results += self.write_batch(
+                        [(dict(data) if data else data, rec)],
+                        create_method)
+            except Exception:
+                sync_ctx.clear_records()
+                self.env.clear()
+                error_obj.add_error(
+                    self, key, data, traceback.format_exc(), run_id)
+                sync_ctx.stats.count('failed')
+                results.append(False)
+        return results
+
+    def _transform_columns(self, data_list):
+        """Map values are applied to the whole column of the batch.
+        Returns {field id: list of values}"""
+        transformed = {}
+        field_obj = self.env['webservice.mapper.fields']
+        for fp in self._get_plan().fields:
+            if fp.has_map:
+                transformed[fp.field_id] = field_obj.browse(
+                    fp.field_id).transform_values([
+                        data_read.get(fp.source) if data_read else None
+                        for data_read in data_list])
+        return transformed
+
+    def write_batch(self, rows, create_method='before'):
+        """Writes a list of (data_read, odoo_rec). All the new records are
+        created with one create and the existing records with the same
+        values are written together
+            --- RETURN ---
+            list with the result of write_data for each row
+        """
+        plan = self._get_plan()
+        model_obj = self.env[plan.model].sudo()
+        results = [False] * len(rows)
+        row_recs = {}
+        # Records to create and the rows that creates them
+        to_create, create_rows, new_keys = [], {}, {}
+        # Values to write by record id, grouped when they are written
+        to_write, to_write_after, dup_writes = {}, {}, []
+        stats = self._get_sync_context().stats
+        with stats.timer('transform'):
+            transformed = self._transform_columns(
+                [data_read for data_read, odoo_rec in rows])
+        prepared = [False] * len(rows)
+        for i, (data_read, odoo_rec) in enumerate(rows):
+            if not data_read:
+                continue
+            with stats.timer('transform'):
+                prepared[i] = self._prepare_write_data(data_read, {
+                    k: v[i] for k, v in transformed.items()})
+        # The records of the unique fields are searched for the batch
+        with stats.timer('write'):
+            found = self._search_unique_records([
+                values[2] for values, (data_read, odoo_rec)
+                in zip(prepared, rows) if values and not odoo_rec])
+        for i, (data_read, odoo_rec) in enumerate(rows):
+            if not prepared[i]:
+                continue
+            data_write, data_write_after, domain = prepared[i]
+            if self.debug_mode:
+                self._debug_data_write(data_write)
+            # Update Logic
+            new_key = domain and repr(domain)
+            if not odoo_rec and new_key in new_keys:
+                # The record is created by a previous row of the batch
+                pos = new_keys[new_key]
+                create_rows.setdefault(pos, []).append(i)
+                if plan.update:
+                    dup_writes.append((pos, data_write))
+                if data_write_after:
+                    dup_writes.append((pos, data_write_after))
+                continue
+            if not odoo_rec and domain:
+                if self.debug_mode:
+                    self.result += "SEARCH DOMAIN:  %s\n" % domain
+                odoo_rec = found.get(new_key)
+                if odoo_rec is None:
+                    with stats.timer('write'):
+                        odoo_rec = model_obj.search(domain)
+            if odoo_rec:
+                if plan.update:
+                    self._group_write(to_write, odoo_rec, data_write)
+                if data_write_after:
+                    self._group_write(
+                        to_write_after, odoo_rec, data_write_after)
+                row_recs[i] = odoo_rec
+                continue
+            if not plan.create_active:
+                results[i] = None
+                continue
+            if create_method == 'together':
+                # Returns a dict with data
+                results[i] = data_write
+                continue
+            if new_key:
+                new_keys[new_key] = len(to_create)
+            create_rows[len(to_create)] = [i]
+            to_create.append(
+                data_write)
+            if data_write_after:
+                dup_writes.append((len(to_create) - 1, data_write_after))
+        with stats.timer('write'):
+            for values, ids in self._get_write_groups(to_write):
+                model_obj.browse(ids).write(values)
+                stats.count('updated', len(ids))
+            if to_create:
+                created = model_obj.create(to_create)
+                for pos, created_rec in enumerate(created):
+                    for i in create_rows[pos]:
+                        row_recs[i] = created_rec
+                stats.count('created', len(created))
+            for i in sorted(row_recs):
+                for method in plan.method_calls:
+                    try:
+                        getattr(row_recs[i], method)()
+                    except Exception as err:
+                        _logger.info('Error with calling method %s' % err)
+            for values, ids in self._get_write_groups(to_write_after):
+                model_obj.browse(ids).write(values)
+            for pos, values in dup_writes:
+                created[pos].write(values)
+        for i, odoo_rec in row_recs.items():
+            results[i] = odoo_rec[0]
+        return results
+
+    def _search_unique_records(self, domains):
+        """Searches with one query by group of fields the records of the
+        domains made of '=' conditions. Returns a dict with k=repr of
+        the domain and v=records, the other domains are not in it and
+        are searched one by one"""
+        model_obj = self.env[self._get_plan().model].sudo()
+        groups = {}
+        for domain in domains:
+            if domain and all(self._is_unique_leaf(model_obj, leaf)
+                              for leaf in domain):
+                names = tuple(leaf[0] for leaf in domain)
+                groups.setdefault(names, []).append(domain)
+        res = {}
+        for names, group in groups.items():
+            records = model_obj.search([
+                (name, 'in', list({domain[pos][2] for domain in group}))
+                for pos, name in enumerate(names)])
+            # Values compared as text, like the database compares them
+            index = {}
+            for rec in records:
+                values = tuple(str(rec[name].id if rec._fields[name].type
+                                   == 'many2one' else rec[name])
+                               for name in names)
+                index[values] = index.get(values, model_obj) | rec
+            for domain in group:
+                res[repr(domain)] = index.get(
+                    tuple(str(leaf[2]) for leaf in domain), model_obj)
+        return res
+
+    def _is_unique_leaf(self, model_obj, leaf):
+        field = type(leaf) in (list, tuple) and len(leaf) == 3 and \
+            leaf[1] == '=' and model_obj._fields.get(leaf[0])
+        return bool(field) and field.type in UNIQUE_TYPES and \
+            isinstance(leaf[2], (int, str)) and \
+            not isinstance(leaf[2], bool)
+
+    def _group_write(self, to_write, odoo_rec, values):
+        """Adds the values to write to each record. The values of a
+        record written by several rows of the batch are merged in the
+        order of the rows, so the last row wins"""
+        for rec_id in odoo_rec.ids:
+            to_write[rec_id] = dict(to_write.get(rec_id, {}), **values)
+
+    def _get_write_groups(self, to_write):
+        """Returns a list of (values, ids) with the records that are
+        written with the same values"""
+        groups = {}
+        for rec_id, values in to_write.items():
+            key = repr(sorted(values.items()))
+            groups.setdefault(key, (values, []))[1].append(rec_id)
+        return list(groups.values())
+
+    def _debug_data_write(self, data_write):
+        # Avoid binary fields in the resut
+        data_debug = data_write.copy()
+        for bf_name in self._get_plan().binary_fields:
+            if data_debug.get(bf_name):
+                del data_debug[bf_name]
+        self.result += "\n----DATA WRITE----\n%s" % str(data_debug)
+
+    def _prepare_write_data(self, data_read, transformed=None):
+        """Returns the values to write before and after the record is
+        created and the domain to search the record in the current db.
+        transformed: dict with the values already transformed by field id
+        """
+        plan = self._get_plan()
+        transformed = transformed or {}
         # Init Variables
         domain, data_write = [], {}
-        model_obj = self.env[self.odoo_model.model].sudo()
         # Get all Mapped Fields related with other models
-        dependences_ids = self.mapper_fields_ids.filtered(
-            lambda x: x.odoo_relation)
-        for dependence in dependences_ids:
-            field_name = dependence.source_field
-            # Continue if we don't have source data for the dependence
-            if not data_read.get(field_name):
-                continue
-            is_o2m = dependence.odoo_field.ttype in ["one2many", "many2many"]
-            # Search record values in the current database
-            res_values = data_read[field_name]
-            # If there is a mapper for the dependence set up
-            if dependence.dependence_id:
-                if is_o2m:
-                    # Recursive sync data for get a odoo record
-                    #  or dict with data if create_method == together
-                    depen_recs = dependence.dependence_id.sync_data(
-                        res_id=res_values,
-                        create_method=dependence.create_method)
-                    if not depen_recs:
-                        continue
-                    depen_vals = []
-                    # Separate Odoo record from data values
-                    dict_values = [x for x in depen_recs if type(x) is dict]
-                    record_values = [
-                        x for x in depen_recs if x not in dict_values
-                    ]
-                    if record_values:
-                        depen_vals.append(
-                            (6, 0, [x.id for x in record_values]))
-                        if dependence.unique:
-                            domain.append((dependence.odoo_field.name, 'in',
-                                           [x.id for x in record_values]))
-                    depen_vals += [(0, 0, val) for val in dict_values]
-                else:
-                    # res_values[0] because in many2one field
-                    # the API of odoo returns a tuple (id, 'display_name')
-                    value = dependence.dependence_id.sync_data(
-                        res_id=res_values[0])
-                    if not value or not value[0]:
-                        continue
-                    depen_vals = value[0].id
-                    if dependence.unique:
-                        domain.append(
-                            (dependence.odoo_field.name, '=', depen_vals))
-            else:
-                # If there isn't a mapper set up
-                # search in the current database by display_name or x_old_id
-                # Is usefull for models like currency, taxes, accounts etc..
-                depen_ids = dependence.search_record(
-                    value=res_values, many2many=is_o2m, search_name='odoo' in
-                    self.webservice_id.ws_type)
-                if depen_ids:
-                    depen_vals = ([(6, 0, [x.id for x in depen_ids])]
-                                  if is_o2m else depen_ids.id) \
-                        if depen_ids else False
+        with self._get_sync_context().stats.timer('dependence'):
+            for fp in plan.relational:
+                field_name = fp.source
+                # Continue if we don't have source data for the dependence
+                if not data_read.get(field_name):
+                    continue
+                # Search record values in the current database
+                res_values = data_read[field_name]
+                # If there is a mapper for the dependence set up
+                if fp.dependence_id:
+                    dep_mapper = self.browse(fp.dependence_id)
+                    # Synced dependences are only searched, a dry run
+                    # never syncs them
+                    dry_run = self.env.context.get('ws_dry_run')
+                    lookup = (dry_run or self.env.context.get(
+                        'ws_lookup_dependences')) and \
+                        dep_mapper._get_plan().search_field
+                    if fp.is_x2many:
+                        # Recursive sync data for get a odoo record
+                        #  or dict with data if create_method == together
+                        depen_recs = lookup and fp.ttype == 'many2many' and \
+                            dep_mapper._search_odoo_records(res_values)
+                        if not dry_run and (not depen_recs or
+                                            len(depen_recs) < len(res_values)):
+                            depen_recs = dep_mapper.sync_data(
+                                res_id=res_values,
+                                create_method=fp.create_method)
+                        if not depen_recs:
+                            continue
+                        depen_vals = []
+                        # Separate Odoo record from data values
+                        dict_values = [
+                            x for x in depen_recs if type(x) is dict]
+                        record_values = [
+                            x for x in depen_recs if x not in dict_values
+                        ]
+                        if record_values:
+                            depen_vals.append(
+                                (6, 0, [x.id for x in record_values]))
+                            if fp.unique:
+                                domain.append((fp.name, 'in',
+                                               [x.id for x in record_values]))
+                        depen_vals += [(0, 0, val) for val in dict_values]
+                    else:
+                        # res_values[0] because in many2one field
+                        # the API of odoo returns a tuple (id, 'display_name')
+                        # SQL sources give the key of the related row
+                        if type(res_values) in (list, tuple):
+                            res_values = res_values[0]
+                        value = lookup and dep_mapper._search_odoo_records(
+                            res_values)
+                        value = value or not dry_run and \
+                            dep_mapper.sync_data(res_id=res_values)
+                        if not value or not value[0]:
+                            continue
+                        depen_vals = value[0].id
+                        if fp.unique:
+                            domain.append((fp.name, '=', depen_vals))
                 else:
-                    depen_vals = False
-            data_write.update({dependence.odoo_field.name: depen_vals})
-            data_read.pop(field_name)
+                    # If there isn't a mapper set up
+                    # search in the current database by display_name or
+                    # x_old_id. Is usefull for models like currency, taxes,
+                    # accounts etc..
+                    depen_ids = self.env['webservice.mapper.fields'].browse(
+                        fp.field_id).search_record(
+                            value=res_values, many2many=fp.is_x2many,
+                            search_name=plan.search_name)
+                    if depen_ids:
+                        depen_vals = ([(6, 0, [x.id for x in depen_ids])]
+                                      if fp.is_x2many else depen_ids.id)
+                    else:
+                        depen_vals = False
+                data_write.update({fp.name: depen_vals})
+                data_read.pop(field_name)
         data_write_after = {}
         # Prepare a dict with not relational values
         # Also prepare a domain with unique values
         OR_domain = []
-        for field_id in self.mapper_fields_ids:
+        for fp in plan.fields:
             # Not value for the field found in the source DB
-            if field_id.source_field not in data_read.keys():
+            if fp.source not in data_read:
                 continue
-            value = data_read[field_id.source_field]
-            if (not value and field_id.odoo_field.ttype not in
+            value = data_read[fp.source]
+            if (not value and fp.ttype not in
                     ['boolean', 'integer', 'float']):
                 continue
             # Add field to the domain
-            if field_id.unique:
-                if field_id.search_operator == '|':
-                    OR_domain += field_id.get_field_domain(value)
+            if fp.unique:
+                op = 'in' if type(value) is list else '='
+                if fp.search_operator == '|':
+                    OR_domain.append((fp.name, op, value))
                 else:
-                    domain += field_id.get_field_domain(value)
+                    domain.append((fp.name, op, value))
             # Separate dicts between after and together or before
             # Also transform data if map is set
-            if field_id.create_method == "after":
-                data_write_after.update({
-                    field_id.odoo_field.name:
-                    field_id.transform_data(value)
-                })
+            if fp.field_id in transformed:
+                value = transformed[fp.field_id]
+            elif fp.has_map:
+                value = self.env['webservice.mapper.fields'].browse(
+                    fp.field_id).transform_data(value)
+            if fp.create_method == "after":
+                data_write_after[fp.name] = value
             else:
-                data_write.update({
-                    field_id.odoo_field.name:
-                    field_id.transform_data(value)
-                })
+                data_write[fp.name] = value
         # Fill with company
-        if self.company_field:
-            data_write.update(
-                {self.company_field: self.webservice_id.company_id.id})
-            domain += bool(domain) and self.get_company_domain() or []
+        if plan.company_field:
+            data_write[plan.company_field] = plan.company_id
+            domain += bool(domain) and list(plan.company_domain) or []
         # ['|' * len OR domain  + domain]
         domain = ['|' for x in range(len(OR_domain) - 1)] + OR_domain + domain
-        found = False
         # Delete None values
         data_write = {k: v for k, v in data_write.items() if v is not None}
-        # Get Default Values and adds to data write
-        data_write = {**model_obj.default_get(data_write), **data_write}
-        if self.debug_mode:
-            # Avoid binary fields in the resut
-            binary_field = self.mapper_fields_ids.filtered(
-                lambda x: x.field_type == "binary")
-            data_debug = data_write.copy()
-            if binary_field:
-                for bf_name in binary_field.mapped('odoo_field'). \
-                        mapped('name'):
-                    if data_debug.get(bf_name):
-                        del data_debug[bf_name]
-            self.result += "\n----DATA WRITE----\n%s" % str(data_debug)
-        # Update Logic
-        if not odoo_rec and domain:
-            if self.debug_mode:
-                self.result += "SEARCH DOMAIN:  %s\n" % domain
-            odoo_rec = model_obj.search(domain)
-        if odoo_rec:
-            if self.update:
-                odoo_rec.sudo().write(data_write)
-        else:
-            if not self.create_active:
-                return
-            if create_method == 'together':
-                # Returns a dict with data
-                return data_write
-            odoo_rec = model_obj.create(data_write)
-        if self.method_calls:
-            if not found or (found and self.update):
-                for method in self.method_calls.split(';'):
-                    try:
-                        getattr(odoo_rec, method)()
-                    except Exception as err:
-                        _logger.info('Error with calling method %s' % err)
-        if data_write_after:
-            odoo_rec.sudo().write(data_write_after)
-        return odoo_rec[0]
+        return data_write, data_write_after, domain
@@ -1,5 +1,7 @@
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError, ValidationError
+import ast
+from ..tools.sync_cache import normalize_name
 
 
 class WebserviceMapperFields(models.Model):
@@ -57,13 +59,10 @@ class WebserviceMapperFields(models.Model):
         """This function returns company domain if
            the model has a company_id field"""
         self.ensure_one()
-        model_obj = self.env['ir.model'].search([
-                ('model', '=', self.odoo_field.relation)
-            ])
-        if not model_obj or not self.webservice_mapper_id.webservice_id:
+        if not self.odoo_relation or \
+                not self.webservice_mapper_id.webservice_id:
             return []
-        if model_obj.field_id.filtered(
-             lambda o: o.name == 'company_id'):
+        if self.env['webservice.metadata'].has_company(self.odoo_relation):
             company_id = self.webservice_mapper_id.webservice_id.company_id
             return [("company_id", "=", company_id.id)]
         return []
@@ -72,22 +71,50 @@ class WebserviceMapperFields(models.Model):
         op = 'in' if type(value) is list else '='
         return [(self.odoo_field.name, op, value)]
 
+    @api.multi
+    def write(self, vals):
+        res = super(WebserviceMapperFields, self).write(vals)
+        if 'map_values' in vals:
+            self.clear_caches()
+        if any(f in vals for f in ['map_values', 'odoo_field',
+                                   'source_field']):
+            # The written values change, the records must be written again
+            self.env['webservice.sync.hash'].clear_hashes(
+                self.mapped('webservice_mapper_id').ids)
+        return res
+
+    @tools.ormcache('self.id')
+    def _get_map_values(self):
+        """Returns the dict of map_values, it is parsed only once"""
+        if not self.map_values:
+            return {}
+        try:
+            transfomer = ast.literal_eval(self.map_values)
+        except (ValueError, SyntaxError):
+            transfomer = None
+        if not isinstance(transfomer, dict):
+            raise UserError(_("Map values of %s are incorrect") %
+                            self.odoo_field.name)
+        return transfomer
+
     def transform_data(self, val):
         """Recive, transform and return data accordingly
          with the map_values field"""
         self.ensure_one()
+        return self.transform_values([val])[0]
+
+    def transform_values(self, values):
+        """Transforms a list of values with the map_values field"""
+        self.ensure_one()
+        transfomer = self._get_map_values()
+        if not transfomer:
+            return list(values)
+        get = transfomer.get
         try:
-            if not self.map_values:
-                return val
-            transfomer = eval(self.map_values)
-            if transfomer:
-                return transfomer.get(val, False) or val
-            else:
-                return val
-        except Exception:
+            return [get(val, False) or val for val in values]
+        except TypeError:
             raise UserError(_("Map values of %s are incorrect") %
                             self.odoo_field.name)
-        return val
 
     @api.multi
     def create_dependence(self):
@@ -103,9 +130,9 @@ class WebserviceMapperFields(models.Model):
         in the current field Returns a record"""
         try:
             parent_id = self.webservice_mapper_id
-            model_obj = self.env['ir.model'].search([
-                ('model', '=', self.odoo_field.relation)
-            ])
+            model_obj = self.env['ir.model'].browse(
+                self.env['webservice.metadata'].get_model_id(
+                    self.odoo_field.relation))
             mapper_obj = self.env['webservice.mapper'].search([
                 ('odoo_model', '=', model_obj.id),
                 ('webservice_id', '=', parent_id.webservice_id.id),
@@ -136,11 +163,8 @@ class WebserviceMapperFields(models.Model):
         except Exception:
             raise UserError(_("Model %s not found!") % self.odoo_relation)
         if 'x_old_id' in model_obj._fields:
-            if many2many:
-                domain = [('x_old_id', 'in', value)]
-            else:
-                domain = [('x_old_id', '=', value[0])]
-            rec = self.env[self.odoo_relation].search(domain)
+            rec = self._search_old_ids(
+                model_obj, value if many2many else [value[0]])
             if rec and many2many:
                 return rec
             elif len(rec) == 1:
@@ -149,21 +173,52 @@ class WebserviceMapperFields(models.Model):
         if not search_name or many2many:
             return False
         if 'display_name' in model_obj._fields:
-            # This can slow the process
             # Display name is a field computed we cannot search
-            # with the ORM
-            domain = []
+            # with the ORM, the names are indexed once by run
+            rec_id = value[1] and self._get_name_index(model_obj).get(
+                normalize_name(value[1]))
+            return model_obj.browse(rec_id) if rec_id else None
         elif 'name' in model_obj._fields:
             domain = [('name', '=', value[1])]
         else:
             field = False
         if field:
             rec = self.env[self.odoo_relation].search(domain)
-            if not domain and rec:
-                rec = rec.filtered(lambda x: x.display_name == value[1])
             if len(rec) == 1:
                 return rec
 
+    def _get_name_index(self, model_obj, batch_size=1000):
+        """Returns the dict normalized display name -> id of the model,
+        the ambiguous names have None. Built with name_get in batches"""
+        names = self.env['webservice.mapper']._get_sync_context().names
+        if model_obj._name not in names:
+            index = {}
+            ids = model_obj.search([]).ids
+            for i in range(0, len(ids), batch_size):
+                for rec_id, name in model_obj.browse(
+                        ids[i:i + batch_size]).name_get():
+                    key = normalize_name(name)
+                    index[key] = None if key in index else rec_id
+            names[model_obj._name] = index
+        return names[model_obj._name]
+
+    def _search_old_ids(self, model_obj, values):
+        """Search by x_old_id the values not resolved yet in the run"""
+        xref = self.env['webservice.mapper']._get_sync_context().xref
+        odoo_ids, missing = [], []
+        for value in values:
+            odoo_id = xref.get((model_obj._name, 'x_old_id', value))
+            if odoo_id:
+                odoo_ids.append(odoo_id)
+            else:
+                missing.append(value)
+        if missing:
+            found = model_obj.search([('x_old_id', 'in', missing)])
+            for rec in found:
+                xref[(model_obj._name, 'x_old_id', rec.x_old_id)] = rec.id
+            odoo_ids += found.ids
+        return model_obj.browse(odoo_ids)
+
     def open_mapper(self):
         self.ensure_one()
         if not self.dependence_id:
@@ -0,0 +1,57 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, models, tools
+from collections import namedtuple
+
+FieldInfo = namedtuple('FieldInfo', ['id', 'ttype', 'relation', 'required'])
+
+
+class WebserviceMetadata(models.AbstractModel):
+    """Models and fields of the current database used by the mappers.
+    They are cached by registry, the cache is cleared when the registry
+    is reloaded or a field is created"""
+    _name = 'webservice.metadata'
+    _description = 'Webservice Metadata'
+
+    @api.model
+    @tools.ormcache('model')
+    def get_model_id(self, model):
+        """Returns the id of the ir.model or False"""
+        return self.env['ir.model'].sudo().search(
+            [('model', '=', model)], limit=1).id
+
+    @api.model
+    @tools.ormcache('model')
+    def get_fields(self, model):
+        """Returns a dict with k=field name and v=FieldInfo. The dict is
+        shared, it must not be modified"""
+        return {
+            field['name']: FieldInfo(
+                field['id'], field['ttype'], field['relation'] or False,
+                field['required'])
+            for field in self.env['ir.model.fields'].sudo().search_read(
+                [('model', '=', model)],
+                ['name', 'ttype', 'relation', 'required'])
+        }
+
+    @api.model
+    def get_field_id(self, model, name):
+        """Returns the id of the ir.model.fields or False"""
+        info = self.get_fields(model).get(name)
+        return info.id if info else False
+
+    @api.model
+    def get_relation(self, model, name):
+        info = self.get_fields(model).get(name)
+        return info.relation if info else False
+
+    @api.model
+    def has_company(self, model):
+        return 'company_id' in self.get_fields(model)
+
+    @api.model
+    def get_required_field_ids(self, model):
+        """Ids of the required fields, the company is set by the mapper"""
+        return [info.id for name, info in self.get_fields(model).items()
+                if info.required and 'company_id' not in name]
@@ -0,0 +1,109 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, _
+from odoo.addons.queue_job.job import job
+from odoo.exceptions import UserError
+from ast import literal_eval
+import traceback
+
+
+class WebserviceSyncError(models.Model):
+    """Source records that failed to sync. A failing record doesn't abort
+    the rest of its batch, it is stored here to be retried"""
+    _name = 'webservice.sync.error'
+    _description = 'Webservice Sync Error'
+    _order = 'write_date desc, id desc'
+    _rec_name = 'source_key'
+
+    mapper_id = fields.Many2one(
+        comodel_name='webservice.mapper',
+        required=True,
+        index=True,
+        ondelete='cascade')
+    webservice_id = fields.Many2one(
+        related='mapper_id.webservice_id', store=True)
+    run_id = fields.Many2one(
+        comodel_name='webservice.sync.run',
+        ondelete='set null')
+    source_key = fields.Char(required=True, readonly=True)
+    key_repr = fields.Char(
+        required=True, readonly=True, index=True,
+        help="Source key written as a python literal")
+    payload = fields.Text(readonly=True, help="Source row read")
+    error = fields.Text(readonly=True)
+    attempts = fields.Integer(default=1, readonly=True)
+    state = fields.Selection(
+        selection=[('pending', 'Pending'),
+                   ('retrying', 'Retrying'),
+                   ('solved', 'Solved')],
+        default='pending', required=True)
+
+    @api.model
+    def add_error(self, mapper, key, data, error, run_id=False):
+        """Stores the error of a source key, the previous error of the
+        key is updated"""
+        payload = {k: '<binary>' if isinstance(v, bytes) else v
+                   for k, v in (data or {}).items()}
+        values = {
+            'payload': repr(payload),
+            'error': error,
+            'state': 'pending',
+        }
+        if run_id:
+            values['run_id'] = run_id
+        rec = self.sudo().search([
+            ('mapper_id', '=', mapper.id),
+            ('key_repr', '=', repr(key))], limit=1)
+        if rec:
+            values['attempts'] = rec.attempts + 1
+            rec.write(values)
+            return rec
+        return self.sudo().create(dict(
+            values, mapper_id=mapper.id, run_id=run_id, source_key=str(key),
+            key_repr=repr(key)))
+
+    @api.multi
+    def action_retry(self):
+        """Creates a job by mapper and batch with the pending errors"""
+        errors = self.filtered(lambda x: x.state == 'pending')
+        if not errors:
+            raise UserError(_("There are no pending errors to retry"))
+        for mapper in errors.mapped('mapper_id'):
+            mapper_errors = errors.filtered(
+                lambda x: x.mapper_id == mapper)
+            size = max(mapper.batch_size, 1)
+            for i in range(0, len(mapper_errors), size):
+                batch = mapper_errors[i:i + size]
+                batch.write({'state': 'retrying'})
+                batch.with_delay(
+                    channel=mapper._get_job_channel()).retry_errors()
+        return {}
+
+    @job
+    @api.multi
+    def retry_errors(self):
+        """Syncs again the keys of the errors of one mapper. The keys
+        that fail again are set back to pending by add_error, and all of
+        them when the whole sync fails"""
+        errors = self.filtered(lambda x: x.state == 'retrying')
+        if not errors:
+            return
+        mapper = errors.mapped('mapper_id')
+        try:
+            with self.env.cr.savepoint():
+                mapper.sync_data(
+                    res_id=[literal_eval(x.key_repr) for x in errors])
+        except Exception:
+            mapper._get_sync_context().clear_records()
+            self.env.clear()
+            error = traceback.format_exc()
+            for rec in errors:
+                rec.write({
+                    'state': 'pending',
+                    'error': error,
+                    'attempts': rec.attempts + 1,
+                })
+            return
+        errors.filtered(lambda x: x.state == 'retrying').write(
+            {'state': 'solved'})
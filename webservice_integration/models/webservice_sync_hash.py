@@ -0,0 +1,56 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+
+class WebserviceSyncHash(models.Model):
+    """Hash of the mapped values of each source record synced by a mapper.
+    The table is read and written with SQL in batches"""
+    _name = 'webservice.sync.hash'
+    _description = 'Webservice Sync Hash'
+    _log_access = False
+
+    mapper_id = fields.Many2one(
+        comodel_name='webservice.mapper',
+        required=True,
+        ondelete='cascade')
+    source_key = fields.Char(required=True)
+    row_hash = fields.Char(required=True)
+
+    _sql_constraints = [
+        ('mapper_key_uniq', 'unique(mapper_id, source_key)',
+         'The source key must be unique by mapper'),
+    ]
+
+    @api.model
+    def get_hashes(self, mapper_id, keys):
+        """Returns a dict with k=source key and v=stored hash"""
+        keys = tuple(str(key) for key in keys if key is not None)
+        if not keys:
+            return {}
+        self.env.cr.execute("""SELECT source_key, row_hash
+            FROM webservice_sync_hash
+            WHERE mapper_id = %s AND source_key IN %s""", (mapper_id, keys))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def set_hashes(self, mapper_id, hashes):
+        """Inserts or updates the hashes of a dict k=source key, v=hash"""
+        if not hashes:
+            return
+        params = []
+        for key, value in hashes.items():
+            params += [mapper_id, str(key), value]
+        self.env.cr.execute("""INSERT INTO webservice_sync_hash
+            (mapper_id, source_key, row_hash) VALUES %s
+            ON CONFLICT (mapper_id, source_key)
+            DO UPDATE SET row_hash = EXCLUDED.row_hash""" % ', '.join(
+            ['(%s, %s, %s)'] * len(hashes)), params)
+
+    @api.model
+    def clear_hashes(self, mapper_ids):
+        """The records of the mappers will be written on the next sync"""
+        if mapper_ids:
+            self.env.cr.execute("""DELETE FROM webservice_sync_hash
+                WHERE mapper_id IN %s""", (tuple(mapper_ids),))
@@ -0,0 +1,211 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+from ..tools.sync_stats import peak_memory
+from psycopg2 import OperationalError
+import random
+import time
+import logging
+_logger = logging.getLogger(__name__)
+
+# Tries of the transactions that write the figures of a run
+WRITE_TRIES = 5
+
+
+class WebserviceSyncRun(models.Model):
+    """Counters and times of a synchronization of a mapper. The jobs of
+    the run write their figures in short transactions of their own when
+    they are committed, so the row of the run is never locked by the
+    transaction of a job"""
+    _name = 'webservice.sync.run'
+    _description = 'Webservice Sync Run'
+    _order = 'start_date desc, id desc'
+
+    name = fields.Char(required=True)
+    mapper_id = fields.Many2one(
+        comodel_name='webservice.mapper',
+        required=True,
+        index=True,
+        ondelete='cascade')
+    webservice_id = fields.Many2one(
+        related='mapper_id.webservice_id', store=True)
+    state = fields.Selection(
+        selection=[('running', 'Running'),
+                   ('done', 'Done'),
+                   ('failed', 'Failed')],
+        default='running', required=True)
+    start_date = fields.Datetime(default=fields.Datetime.now)
+    end_date = fields.Datetime(help="Date of the last data written")
+    jobs_pending = fields.Integer(readonly=True)
+    watermark = fields.Char(
+        readonly=True,
+        help="Watermark of the mapper when all the jobs of the run are done")
+    records_read = fields.Integer(string="Read")
+    records_created = fields.Integer(string="Created")
+    records_updated = fields.Integer(string="Updated")
+    records_skipped = fields.Integer(
+        string="Skipped",
+        help="Existing records not updated and records without changes")
+    records_failed = fields.Integer(string="Failed")
+    time_read = fields.Float(
+        string="Read Time", help="Seconds reading the source")
+    time_transform = fields.Float(
+        string="Transform Time",
+        help="Seconds preparing the values to write")
+    time_write = fields.Float(
+        string="Write Time",
+        help="Seconds searching and writing the records in odoo")
+    time_dependence = fields.Float(
+        string="Dependence Time",
+        help="Seconds resolving the related records")
+    duration = fields.Float(help="Seconds since the start of the run")
+    rows_per_sec = fields.Float(
+        string="Rows/s", group_operator='avg')
+    peak_memory = fields.Float(
+        string="Peak Memory (MB)", group_operator='max',
+        help="Peak memory of the worker that ran the jobs")
+    lookup_dependences = fields.Boolean(
+        help="The related records are searched before syncing them")
+    shard_ids = fields.One2many(
+        comodel_name='webservice.sync.run.shard',
+        inverse_name='run_id',
+        string='Shards')
+    error_ids = fields.One2many(
+        comodel_name='webservice.sync.error',
+        inverse_name='run_id',
+        string='Errors')
+
+    _counters = ['read', 'created', 'updated', 'skipped', 'failed']
+    _timers = ['read', 'transform', 'write', 'dependence']
+
+    @api.multi
+    def add_stats(self, stats, jobs_done=0):
+        """Adds the counters and times of stats to the run when the
+        transaction of the job is committed"""
+        self.ensure_one()
+        params = [stats.counts[name] for name in self._counters]
+        params += [stats.times[name] for name in self._timers]
+        params.append(peak_memory())
+        self.env.cr.after('commit', lambda: self._write_apart(
+            '_write_stats', params, jobs_done))
+
+    def _write_stats(self, params, jobs_done):
+        """When all the jobs of the run are done it is set as done, also
+        when a job failed before being requeued, and the job that ends
+        it advances the watermark of the mapper"""
+        sets = ["records_{0} = COALESCE(records_{0}, 0) + %s".format(name)
+                for name in self._counters]
+        sets += ["time_{0} = COALESCE(time_{0}, 0) + %s".format(name)
+                 for name in self._timers]
+        self.env.cr.execute("""UPDATE webservice_sync_run SET %s,
+            peak_memory = GREATEST(COALESCE(peak_memory, 0), %%s),
+            jobs_pending = COALESCE(jobs_pending, 0) - %%s,
+            state = CASE WHEN COALESCE(jobs_pending, 0) - %%s <= 0
+                THEN 'done' ELSE state END,
+            end_date = (now() at time zone 'UTC')
+            WHERE id = %%s RETURNING jobs_pending""" % ', '.join(sets),
+            params + [jobs_done, jobs_done, self.id])
+        row = self.env.cr.fetchone()
+        if not row:
+            return
+        self._update_rates(self.env.cr)
+        if jobs_done and row[0] <= 0 < row[0] + jobs_done:
+            self.mapper_id._advance_watermark(self.watermark)
+
+    @api.multi
+    def add_failure(self, count):
+        """Counts the records of a failed job. The transaction of the job
+        is rolled back, so they are written when the transaction ends"""
+        self.ensure_one()
+        # Handlers are removed after each commit or rollback
+        for event in ['rollback', 'commit']:
+            self.env.cr.after(event, lambda: self._write_apart(
+                '_write_failure', count))
+
+    def _write_failure(self, count):
+        self.env.cr.execute("""UPDATE webservice_sync_run
+            SET records_failed = COALESCE(records_failed, 0) + %s,
+                state = 'failed',
+                end_date = (now() at time zone 'UTC')
+            WHERE id = %s""", (count, self.id))
+        self._update_rates(self.env.cr)
+
+    def _write_apart(self, method, *args):
+        """Calls method of the run in a transaction of its own. The jobs
+        of the run write the same row, a transaction that conflicts with
+        other one is tried again. The job is already finished, so the
+        errors are only logged"""
+        for tries in range(1, WRITE_TRIES + 1):
+            try:
+                with self.pool.cursor() as cr:
+                    getattr(self.with_env(self.env(cr=cr)), method)(*args)
+                return
+            except OperationalError as err:
+                if err.pgcode not in PG_CONCURRENCY_ERRORS_TO_RETRY or \
+                        tries == WRITE_TRIES:
+                    _logger.exception(
+                        'Figures of sync run %s not written', self.id)
+                    return
+            except Exception:
+                _logger.exception(
+                    'Figures of sync run %s not written', self.id)
+                return
+            time.sleep(random.uniform(0.0, 2 ** tries) / 10)
+
+    def _update_rates(self, cr):
+        cr.execute("""UPDATE webservice_sync_run
+            SET duration = EXTRACT(EPOCH FROM end_date - start_date),
+                rows_per_sec = CASE WHEN end_date > start_date
+                    THEN COALESCE(records_read, 0) /
+                        EXTRACT(EPOCH FROM end_date - start_date)
+                    ELSE 0 END
+            WHERE id IN %s""", (tuple(self.ids),))
+
+    @api.multi
+    def action_resume(self):
+        """Creates again the jobs of the shards not finished, each one
+        starts after the last key committed by the failed job"""
+        for run in self:
+            shards = run.shard_ids.filtered(lambda x: x.state != 'done')
+            if not shards:
+                raise UserError(
+                    _("Run %s has no shards to resume, retry its failed "
+                      "jobs or its errors") % run.name)
+            mapper = run.mapper_id
+            for shard in shards:
+                mapper.with_delay(
+                    channel=mapper._get_job_channel()).sync_shard(
+                        shard.start, shard.stop,
+                        lookup_dependences=run.lookup_dependences,
+                        run_id=run.id, shard_id=shard.id)
+            run.write({'jobs_pending': len(shards), 'state': 'running'})
+        return {}
+
+    @api.multi
+    def action_retry_errors(self):
+        return self.mapped('error_ids').action_retry()
+
+
+class WebserviceSyncRunShard(models.Model):
+    """Range of source keys synced by one job of a run. The last key
+    written is stored with each commit of the job"""
+    _name = 'webservice.sync.run.shard'
+    _description = 'Webservice Sync Run Shard'
+    _order = 'start'
+
+    run_id = fields.Many2one(
+        comodel_name='webservice.sync.run',
+        required=True,
+        index=True,
+        ondelete='cascade')
+    start = fields.Integer(readonly=True)
+    stop = fields.Integer(readonly=True)
+    last_key = fields.Char(
+        readonly=True, help="Last source key committed by the shard")
+    state = fields.Selection(
+        selection=[('pending', 'Pending'),
+                   ('done', 'Done')],
+        default='pending', required=True)
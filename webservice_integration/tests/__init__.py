@@ -1,3 +1,17 @@
 # Copyright 2019 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 from . import test_mapper
+from . import test_instance
+from . import test_tools
+from . import test_connection_pool
+from . import test_sync_cache
+from . import test_diff_report
+from . import test_batch_jobs
+from . import test_watermark
+from . import test_waves
+from . import test_shards
+from . import test_row_hash
+from . import test_dry_run
+from . import test_sync_error
+from . import test_file_connector
+from . import test_benchmark
@@ -0,0 +1,130 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest.mock import patch
+from odoo.tests import common
+from odoo.addons.queue_job.job import Job
+
+
+def run_commit_handlers(env):
+    """Runs the handlers of the commit of the transaction as the queue
+    does when a job ends. The cursors opened by them share the
+    transaction of the test"""
+    registry = env.registry
+    registry.enter_test_mode(env.cr)
+    try:
+        for func in env.cr._pop_event_handlers()['commit']:
+            func()
+    finally:
+        registry.leave_test_mode()
+
+
+class SyncCase(common.TransactionCase):
+    """Syncs the tables of a SQLite source into partners. The rows of the
+    tables have a code, stored in the ref of the partners, and a name"""
+
+    def setUp(self):
+        super(SyncCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'source.db')
+        self.instance = self.env['webservice.instance'].create({
+            'name': 'SQLite',
+            'company_id': self.env.user.company_id.id,
+            'webservice_active': True,
+            'ws_type': 'webservice.con.sqlite',
+            'ws_db': self.db_path,
+        })
+        self.partner_fields = {
+            f.name: f.id for f in self.env['ir.model.fields'].search([
+                ('model', '=', 'res.partner'),
+                ('name', 'in', ['name', 'ref', 'color', 'parent_id'])])}
+        # The caches of the sync can't outlive the transaction of the test
+        self.env.cr.cache.pop('webservice_sync', None)
+
+    def tearDown(self):
+        self.instance.close_connexion()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.env.cr.cache.pop('webservice_sync', None)
+        super(SyncCase, self).tearDown()
+
+    def _execute(self, query, rows=None):
+        """Executes the query in the source, once for each row"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if rows is None:
+                conn.execute(query)
+            else:
+                conn.executemany(query, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _create_table(self, table, rows, columns=('code', 'name')):
+        self._execute('CREATE TABLE %s (%s)' % (table, ', '.join(columns)))
+        self._execute('INSERT INTO %s VALUES (%s)' % (
+            table, ', '.join('?' * len(columns))), rows)
+
+    def _create_mapper(self, table, parent=False, key='code', **values):
+        """Mapper of the table to partners. The code of the rows is
+        searched in the ref of the partners, or with key='id' the
+        integer id of the rows in their color. The parent column of the
+        rows is synced with the parent mapper"""
+        key_field = key == 'id' and 'color' or 'ref'
+        field_vals = [
+            (0, 0, {'odoo_field': self.partner_fields['name'],
+                    'source_field': 'name'}),
+            (0, 0, {'odoo_field': self.partner_fields[key_field],
+                    'source_field': key, 'unique': True}),
+        ]
+        if parent:
+            field_vals.append((0, 0, {
+                'odoo_field': self.partner_fields['parent_id'],
+                'source_field': 'parent_code',
+                'dependence_id': parent.id,
+                'create_method': 'before'}))
+        model = self.env['ir.model'].search([('model', '=', 'res.partner')])
+        return self.env['webservice.mapper'].create(dict({
+            'name': table,
+            'active': True,
+            'webservice_id': self.instance.id,
+            'source_model': table,
+            'odoo_model': model.id,
+            'unique_source_field': key,
+            'search_field': key_field,
+            'batch_size': 2,
+            'mapper_fields_ids': field_vals,
+        }, **values))
+
+    def _get_partners(self, codes):
+        """Partners by ref of the codes"""
+        return {rec.ref: rec for rec in self.env['res.partner'].search(
+            [('ref', 'in', codes)])}
+
+    def _get_jobs(self, model='webservice.mapper'):
+        return self.env['queue.job'].search([
+            ('model_name', '=', model),
+            ('state', '=', 'pending')], order='id')
+
+    def _run_job(self, job):
+        """Performs the job as the queue would do. Each job has its own
+        transaction, so it starts without the caches of the sync. The
+        handlers of its commit are run when it ends, also when it fails
+        like the handlers of its rollback"""
+        self.env.cr.cache.pop('webservice_sync', None)
+        try:
+            # The commits of the job only run their handlers
+            with patch.object(self.env.cr, 'commit',
+                              lambda: run_commit_handlers(self.env)):
+                Job.load(self.env, job.uuid).perform()
+            job.state = 'done'
+        finally:
+            run_commit_handlers(self.env)
+            self.env.invalidate_all()
+
+    def _run_jobs(self, model='webservice.mapper'):
+        """Performs the pending jobs of the model"""
+        for job in self._get_jobs(model):
+            self._run_job(job)
@@ -0,0 +1,45 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from .common import SyncCase
+
+CODES = ['C1', 'C2', 'C3', 'C4', 'C5']
+
+
+class TestBatchJobs(SyncCase):
+
+    def setUp(self):
+        super(TestBatchJobs, self).setUp()
+        self._create_table('contact', [
+            (code, 'Contact %s' % code) for code in CODES])
+        self.mapper = self._create_mapper('contact')
+
+    def test_batch_jobs(self):
+        """One job syncs each batch of keys"""
+        self.mapper.get_data_for_sync()
+        run = self.mapper.sync_run_ids
+        self.assertEqual(len(self._get_jobs()), 3)
+        self.assertEqual(run.jobs_pending, 3)
+        self._run_jobs()
+        partners = self._get_partners(CODES)
+        self.assertEqual(sorted(partners), CODES)
+        self.assertEqual(partners['C4'].name, 'Contact C4')
+        self.assertEqual(run.state, 'done')
+        self.assertEqual(run.jobs_pending, 0)
+        self.assertEqual(run.records_read, 5)
+        self.assertEqual(run.records_created, 5)
+
+    def test_filter_existing_keys(self):
+        """Without update the keys that exist are not synced again"""
+        self.mapper.sync_data(res_id=['C1', 'C2'])
+        self.mapper.update = False
+        self.env.cr.cache.pop('webservice_sync', None)
+        self.assertEqual(self.mapper._filter_existing_keys(CODES),
+                         ['C3', 'C4', 'C5'])
+        self.mapper.get_data_for_sync()
+        self.assertEqual(len(self._get_jobs()), 2)
+        run = self.mapper.sync_run_ids[0]
+        self.assertEqual(run.records_skipped, 2)
+        self._run_jobs()
+        self.assertEqual(sorted(self._get_partners(CODES)), CODES)
+        self.assertEqual(run.records_created, 3)
+        self.assertEqual(run.state, 'done')
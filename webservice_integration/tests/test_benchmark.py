@@ -0,0 +1,170 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from odoo.tests import common, tagged
+from odoo.addons.queue_job.job import Job
+from ..tools.profiler import SQLRecorder
+from .common import run_commit_handlers
+
+_logger = logging.getLogger(__name__)
+
+# Size of the synthetic source, set them in the environment to
+# benchmark bigger sources
+ROWS = int(os.environ.get('WEBSERVICE_BENCHMARK_ROWS', 500))
+DEPTH = int(os.environ.get('WEBSERVICE_BENCHMARK_DEPTH', 2))
+# When it is set the tests fail if a sync needs more queries by row
+MAX_QUERIES = float(os.environ.get('WEBSERVICE_BENCHMARK_MAX_QUERIES', 0))
+
+
+@tagged('-standard', 'webservice_benchmark')
+class TestSyncBenchmark(common.SavepointCase):
+    """Times the sync of a SQLite source of DEPTH + 1 tables with ROWS
+    rows each one. The rows of each table are contacts whose parent is a
+    row of the previous table. Run it with --test-tags
+    webservice_benchmark"""
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestSyncBenchmark, cls).setUpClass()
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.db_path = os.path.join(cls.tmp_dir, 'source.db')
+        cls._create_source()
+        cls.instance = cls.env['webservice.instance'].create({
+            'name': 'Benchmark',
+            'company_id': cls.env.user.company_id.id,
+            'webservice_active': True,
+            'ws_type': 'webservice.con.sqlite',
+            'ws_db': cls.db_path,
+        })
+        cls.mappers = cls._create_mappers()
+        cls.total_rows = ROWS * (DEPTH + 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.instance.close_connexion()
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+        super(TestSyncBenchmark, cls).tearDownClass()
+
+    @classmethod
+    def _create_source(cls):
+        conn = sqlite3.connect(cls.db_path)
+        for level in range(DEPTH + 1):
+            conn.execute("""CREATE TABLE bench_level_%s (
+                code TEXT PRIMARY KEY, name TEXT, email TEXT,
+                parent_code TEXT)""" % level)
+            conn.executemany(
+                "INSERT INTO bench_level_%s VALUES (?, ?, ?, ?)" % level, [(
+                    'L%s-%06d' % (level, i),
+                    'Contact %s of level %s' % (i, level),
+                    'contact%s.%s@example.com' % (i, level),
+                    level and 'L%s-%06d' % (level - 1, i) or None,
+                ) for i in range(ROWS)])
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def _create_mappers(cls):
+        model = cls.env['ir.model'].search([('model', '=', 'res.partner')])
+        partner_fields = {
+            f.name: f.id for f in cls.env['ir.model.fields'].search([
+                ('model', '=', 'res.partner'),
+                ('name', 'in', ['name', 'email', 'ref', 'parent_id'])])}
+        mappers = cls.env['webservice.mapper']
+        for level in range(DEPTH + 1):
+            field_vals = [
+                (0, 0, {'odoo_field': partner_fields['name'],
+                        'source_field': 'name'}),
+                (0, 0, {'odoo_field': partner_fields['email'],
+                        'source_field': 'email'}),
+                (0, 0, {'odoo_field': partner_fields['ref'],
+                        'source_field': 'code', 'unique': True}),
+            ]
+            if level:
+                field_vals.append((0, 0, {
+                    'odoo_field': partner_fields['parent_id'],
+                    'source_field': 'parent_code',
+                    'dependence_id': mappers[-1].id,
+                    'create_method': 'before'}))
+            mappers |= mappers.create({
+                'name': 'Benchmark Level %s' % level,
+                'active': True,
+                'webservice_id': cls.instance.id,
+                'source_model': 'bench_level_%s' % level,
+                'odoo_model': model.id,
+                'unique_source_field': 'code',
+                'search_field': 'ref',
+                'batch_size': 100,
+                'mapper_fields_ids': field_vals,
+            })
+        return mappers
+
+    def setUp(self):
+        super(TestSyncBenchmark, self).setUp()
+        # The caches of the sync can't outlive the savepoint of the test
+        self.env.cr.cache.pop('webservice_sync', None)
+
+    def _measure(self, label, func, rows):
+        recorder = SQLRecorder()
+        start = time.time()
+        with recorder.record(self.env.cr):
+            func()
+        elapsed = time.time() - start
+        queries = len(recorder.queries)
+        _logger.info(
+            '%s: %s rows in %.2f s (%.0f rows/s), %s queries (%.1f by row)'
+            ' in %.2f s', label, rows, elapsed,
+            rows / elapsed if elapsed else 0, queries,
+            queries / float(rows or 1), recorder.total_time())
+        if MAX_QUERIES:
+            self.assertLessEqual(queries / float(rows or 1), MAX_QUERIES)
+        return recorder
+
+    def _count_partners(self):
+        return self.env['res.partner'].search_count(
+            [('ref', '=like', 'L%-%')])
+
+    def _run_jobs(self):
+        """Performs the pending sync jobs as the queue would do"""
+        jobs = self.env['queue.job'].search([
+            ('model_name', '=', 'webservice.mapper'),
+            ('state', '=', 'pending')], order='id')
+        for job in jobs:
+            Job.load(self.env, job.uuid).perform()
+            job.state = 'done'
+
+    def test_sync_data(self):
+        """The last level syncs the rest of levels as dependences"""
+        self._measure('sync_data', self.mappers[-1].sync_data,
+                      self.total_rows)
+        self.assertEqual(self._count_partners(), self.total_rows)
+
+    def test_get_data_for_sync(self):
+        """Each level is synced by jobs after the previous one"""
+        def sync_levels():
+            for mapper in self.mappers:
+                mapper.get_data_for_sync()
+                self._run_jobs()
+        self._measure('get_data_for_sync', sync_levels, self.total_rows)
+        self.assertEqual(self._count_partners(), self.total_rows)
+        parent = self.env['res.partner'].search(
+            [('ref', '=', 'L%s-%06d' % (DEPTH, 0))]).parent_id
+        self.assertEqual(parent.ref, 'L%s-%06d' % (DEPTH - 1, 0))
+
+    def test_sync_unchanged(self):
+        """A second sync of the same data skips the rows by their hash"""
+        mapper = self.mappers[0]
+        mapper.use_row_hash = True
+        mapper.sync_data()
+        self.env.cr.cache.pop('webservice_sync', None)
+        run = mapper._create_sync_run(jobs=1)
+        self._measure('sync_data unchanged',
+                      lambda: mapper.sync_data(run_id=run.id), ROWS)
+        run_commit_handlers(self.env)
+        run.invalidate_cache()
+        self.assertEqual(run.records_skipped, ROWS)
+        self.assertFalse(run.records_updated)
@@ -0,0 +1,85 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import threading
+import time
+from odoo.tests import common
+from ..tools.connection_pool import ConnectionPool, PoolTimeout, get_pool, \
+    pop_pools
+
+
+class TestConnectionPool(common.BaseCase):
+
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        self.opened = []
+        self.closed = []
+
+    def _connect(self):
+        conn = object()
+        self.opened.append(conn)
+        return conn
+
+    def test_reuse(self):
+        pool = ConnectionPool(max_size=2)
+        conn = pool.acquire(self._connect)
+        pool.release(conn)
+        self.assertIs(pool.acquire(self._connect), conn)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_timeout(self):
+        pool = ConnectionPool(max_size=1, timeout=0.1)
+        pool.acquire(self._connect)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self._connect)
+
+    def test_wait_release(self):
+        pool = ConnectionPool(max_size=1, timeout=5)
+        conn = pool.acquire(self._connect)
+        timer = threading.Timer(0.1, pool.release, [conn])
+        timer.start()
+        self.assertIs(pool.acquire(self._connect), conn)
+        timer.join()
+
+    def test_check_and_discard(self):
+        pool = ConnectionPool(max_size=1)
+        conn = pool.acquire(self._connect)
+        pool.release(conn)
+        new_conn = pool.acquire(self._connect, check=lambda c: False,
+                                close=self.closed.append)
+        self.assertIsNot(new_conn, conn)
+        self.assertEqual(self.closed, [conn])
+        pool.release(new_conn, close=self.closed.append, discard=True)
+        self.assertEqual(self.closed, [conn, new_conn])
+        # The discarded connexion left its place in the pool
+        pool.acquire(self._connect)
+
+    def test_idle_expired(self):
+        pool = ConnectionPool(max_size=1, max_idle=0.05)
+        conn = pool.acquire(self._connect)
+        pool.release(conn)
+        time.sleep(0.1)
+        self.assertIsNot(
+            pool.acquire(self._connect, close=self.closed.append), conn)
+        self.assertEqual(self.closed, [conn])
+
+    def test_connect_error(self):
+        pool = ConnectionPool(max_size=1, timeout=0.1)
+
+        def fail():
+            raise IOError('refused')
+        with self.assertRaises(IOError):
+            pool.acquire(fail)
+        pool.acquire(self._connect)
+
+    def test_get_pool(self):
+        key = ('test_tools_db', 0)
+        try:
+            pool, old = get_pool(key + ('a',), 'params')
+            self.assertIsNone(old)
+            self.assertIs(get_pool(key + ('a',), 'params')[0], pool)
+            new_pool, old = get_pool(key + ('a',), 'new params')
+            self.assertIsNot(new_pool, pool)
+            self.assertIs(old, pool)
+            self.assertEqual(pop_pools(key), [new_pool])
+        finally:
+            pop_pools(key)
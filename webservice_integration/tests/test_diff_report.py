@@ -0,0 +1,25 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from odoo.tests import common
+from ..tools.diff_report import DiffReport
+
+
+class TestDiffReport(common.BaseCase):
+
+    def test_counts_and_samples(self):
+        report = DiffReport(sample_size=3, seed=1)
+        for key in range(100):
+            report.add('update', key, {'name': ('a', 'b')})
+        report.add('create', 'new', {'name': (None, 'c')})
+        report.add('unchanged', 'same')
+        self.assertEqual(report.counts['update'], 100)
+        self.assertEqual(report.fields, {'name': 100})
+        self.assertEqual(len(report.samples['update']), 3)
+        self.assertEqual(
+            len({key for key, diffs in report.samples['update']}), 3)
+        self.assertEqual(report.samples['create'],
+                         [('new', {'name': (None, 'c')})])
+        text = report.to_text('Partners')
+        self.assertIn('--DRY RUN OF Partners--', text)
+        self.assertIn('update: 100', text)
+        self.assertIn("name: None -> 'c'", text)
@@ -0,0 +1,32 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import base64
+from .common import SyncCase
+
+CODES = ['C1', 'C2', 'C3']
+
+
+class TestDryRun(SyncCase):
+
+    def setUp(self):
+        super(TestDryRun, self).setUp()
+        self._create_table('contact', [
+            (code, 'Contact %s' % code) for code in CODES])
+        self.mapper = self._create_mapper('contact')
+        self.partner = self.env['res.partner'].create({
+            'name': 'Old', 'ref': 'C1'})
+
+    def test_dry_run(self):
+        """The changes are reported without writing them"""
+        counts = self.mapper.dry_run()
+        self.assertEqual(counts, 'create: 2, update: 1')
+        self.assertEqual(sorted(self._get_partners(CODES)), ['C1'])
+        self.assertEqual(self.partner.name, 'Old')
+        attachment = self.env['ir.attachment'].search([
+            ('res_model', '=', 'webservice.mapper'),
+            ('res_id', '=', self.mapper.id)])
+        self.assertEqual(len(attachment), 1)
+        text = base64.b64decode(attachment.datas).decode()
+        self.assertIn('create: 2', text)
+        self.assertIn('update: 1', text)
+        self.assertIn("name: 'Old' -> 'Contact C1'", text)
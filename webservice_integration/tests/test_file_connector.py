@@ -0,0 +1,60 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import os
+from .common import SyncCase, run_commit_handlers
+
+
+class TestFileConnector(SyncCase):
+    """The keys of a CSV file are text, they are searched in an integer
+    field of the partners"""
+
+    def setUp(self):
+        super(TestFileConnector, self).setUp()
+        with open(os.path.join(self.tmp_dir, 'contact.csv'), 'w') as f:
+            f.write('id,name\n')
+            f.writelines('%s,Contact %s\n' % (i, i) for i in range(1, 11))
+        self.instance.write({
+            'ws_type': 'webservice.con.file',
+            'ws_db': self.tmp_dir,
+        })
+        self.mapper = self._create_mapper('contact', key='id', batch_size=4)
+
+    def _get_contacts(self):
+        return self.env['res.partner'].search([
+            ('color', 'in', list(range(1, 11))),
+            ('name', '=like', 'Contact %')])
+
+    def test_existing_keys(self):
+        """The keys of the records synced are found"""
+        self.mapper.sync_data()
+        self.assertEqual(len(self._get_contacts()), 10)
+        self.mapper.update = False
+        self.env.cr.cache.pop('webservice_sync', None)
+        self.mapper.get_data_for_sync()
+        self.assertFalse(self._get_jobs())
+        self.assertEqual(self.mapper.sync_run_ids[0].records_skipped, 10)
+
+    def test_row_hash(self):
+        """A second sync skips the rows by their hash"""
+        self.mapper.use_row_hash = True
+        self.mapper.sync_data()
+        self.env.cr.cache.pop('webservice_sync', None)
+        run = self.mapper._create_sync_run(jobs=1)
+        self.mapper.sync_data(run_id=run.id)
+        run_commit_handlers(self.env)
+        run.invalidate_cache()
+        self.assertEqual(run.records_skipped, 10)
+        self.assertFalse(run.records_created)
+        self.assertFalse(run.records_updated)
+
+    def test_shards(self):
+        """The bounds of the shards are numeric"""
+        self.mapper.shard_count = 2
+        self.mapper.get_data_for_sync()
+        run = self.mapper.sync_run_ids[0]
+        self.assertEqual(
+            [(x.start, x.stop) for x in run.shard_ids], [(1, 6), (6, 11)])
+        self._run_jobs()
+        self.assertEqual(len(self._get_contacts()), 10)
+        self.assertEqual(run.shard_ids.mapped('last_key'), ['5', '10'])
+        self.assertEqual(run.state, 'done')
@@ -0,0 +1,71 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import os
+import shutil
+import sqlite3
+import tempfile
+from odoo.tests import common
+
+
+class TestInstance(common.TransactionCase):
+
+    def setUp(self):
+        super(TestInstance, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(self.tmp_dir, 'source.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE contact (id INTEGER PRIMARY KEY, "
+                     "name TEXT)")
+        conn.executemany("INSERT INTO contact VALUES (?, ?)",
+                         [(i, 'Contact %s' % i) for i in range(1, 11)])
+        conn.commit()
+        conn.close()
+        # A single connexion in the pool, a nested read that waits for
+        # it fails after one second
+        self.instance = self.env['webservice.instance'].create({
+            'name': 'SQLite',
+            'company_id': self.env.user.company_id.id,
+            'ws_type': 'webservice.con.sqlite',
+            'ws_db': db_path,
+            'pool_size': 1,
+            'timeout': 1,
+        })
+
+    def tearDown(self):
+        self.instance.close_connexion()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        super(TestInstance, self).tearDown()
+
+    def _read_vals(self, domain=None):
+        return {
+            'table': 'contact',
+            'fields': ['id', 'name'],
+            'domain': domain or [],
+            'order': 'id',
+        }
+
+    def test_read_inside_stream(self):
+        batches = self.instance.read_data_batches(
+            self._read_vals(), batch_size=4)
+        try:
+            first = next(batches)
+            self.assertEqual([row['id'] for row in first], [1, 2, 3, 4])
+            rows = self.instance.read_data(
+                self._read_vals([['id', '=', 7]]))
+            self.assertEqual(rows, [{'id': 7, 'name': 'Contact 7'}])
+            self.assertEqual(
+                [row['id'] for batch in batches for row in batch],
+                list(range(5, 11)))
+        finally:
+            batches.close()
+
+    def test_read_column_inside_stream(self):
+        columns = self.instance.read_column(
+            self._read_vals(), batch_size=5)
+        try:
+            self.assertEqual(next(columns), [1, 2, 3, 4, 5])
+            self.assertEqual(
+                len(self.instance.read_data(self._read_vals())), 10)
+            self.assertEqual(next(columns), [6, 7, 8, 9, 10])
+        finally:
+            columns.close()
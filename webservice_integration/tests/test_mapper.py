@@ -11,15 +11,15 @@ class TestMapper(common.TransactionCase):
         super(TestMapper, self).setUp()
         self.Mapper = self.env['webservice.mapper']
         self.Model = self.env['ir.model'].search([
-            'model', '=', 'ir.model',
+            ('model', '=', 'ir.model'),
         ])
         self.FieldMapper = self.env['webservice.mapper.fields']
         self.Field = self.env['ir.model.fields']
 
-        self.Mapper = self.Mappper.create({
+        self.Mapper = self.Mapper.create({
             'name': 'Test Fields',
             'odoo_model': self.Model.id,
-            'source_mode': 'ir.model'
+            'source_model': 'ir.model'
         })
         self.field1 = self.Field.search([
             ('model', '=', 'ir.model'),
@@ -30,26 +30,23 @@ class TestMapper(common.TransactionCase):
             ('name', '=', 'info')
         ])
         self.Mapper.write({
-            'mapper_fields_ids', [(0, 0, {
+            'mapper_fields_ids': [(0, 0, {
                 'odoo_field': self.field1.id
             })]
         })
         self.Mapper.write({
-            'mapper_fields_ids', [(0, 0, {
+            'mapper_fields_ids': [(0, 0, {
                 'odoo_field': self.field2.id,
                 'source_field': 'info_test'
             })]
         })
         self.Mapper.write({
-            'mapper_fields_ids', [(0, 0, {
+            'mapper_fields_ids': [(0, 0, {
                 'odoo_field': self.field2.id,
                 'source_field': 'fail_field'
             })]
         })
 
-    def test_fail(self):
-        self.assertEqual(1, 2, msg="FAILED IN 1=2")
-
     def test_check_mapped_fields(self):
         """ Checks if the _check_mapped_fields works properly
         """
@@ -0,0 +1,43 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from .common import SyncCase
+
+CODES = ['C1', 'C2', 'C3', 'C4', 'C5']
+
+
+class TestRowHash(SyncCase):
+
+    def setUp(self):
+        super(TestRowHash, self).setUp()
+        self._create_table('contact', [
+            (code, 'Contact %s' % code) for code in CODES])
+        self.mapper = self._create_mapper('contact', use_row_hash=True)
+        self.mapper.get_data_for_sync()
+        self._run_jobs()
+        self.partners = self._get_partners(CODES)
+        # Local changes show which records are written again
+        self.partners['C1'].name = 'Local'
+
+    def _sync(self):
+        self.mapper.get_data_for_sync()
+        self._run_jobs()
+        return self.mapper.sync_run_ids[0]
+
+    def test_skip_unchanged(self):
+        """Only the rows changed since the last sync are written"""
+        self._execute("UPDATE contact SET name = 'New' WHERE code = 'C2'")
+        run = self._sync()
+        self.assertEqual(self.partners['C1'].name, 'Local')
+        self.assertEqual(self.partners['C2'].name, 'New')
+        self.assertEqual(run.records_read, 5)
+        self.assertEqual(run.records_skipped, 4)
+        self.assertEqual(run.records_updated, 1)
+        self.assertEqual(run.state, 'done')
+
+    def test_reset_row_hash(self):
+        """After a reset all the rows are written again"""
+        self.mapper.action_reset_row_hash()
+        run = self._sync()
+        self.assertEqual(self.partners['C1'].name, 'Contact C1')
+        self.assertEqual(run.records_skipped, 0)
+        self.assertEqual(run.records_updated, 5)
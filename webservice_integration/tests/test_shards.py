@@ -0,0 +1,66 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from unittest.mock import patch
+from .common import SyncCase
+
+
+class TestShards(SyncCase):
+
+    def setUp(self):
+        super(TestShards, self).setUp()
+        self.names = ['Row %s' % i for i in range(1, 11)]
+        self._create_table(
+            'contact', [(i, 'Row %s' % i) for i in range(1, 11)],
+            columns=('id INTEGER', 'name'))
+        self.mapper = self._create_mapper(
+            'contact', key='id', shard_count=3)
+
+    def _get_synced(self):
+        """Colors of the partners synced from the rows"""
+        return sorted(self.env['res.partner'].search(
+            [('name', 'in', self.names)]).mapped('color'))
+
+    def test_shards(self):
+        self.mapper.get_data_for_sync()
+        run = self.mapper.sync_run_ids
+        self.assertEqual(
+            [(s.start, s.stop) for s in run.shard_ids],
+            [(1, 5), (5, 9), (9, 13)])
+        self.assertEqual(run.jobs_pending, 3)
+        self._run_jobs()
+        self.assertEqual(run.shard_ids.mapped('last_key'), ['4', '8', '10'])
+        self.assertEqual(set(run.shard_ids.mapped('state')), {'done'})
+        self.assertEqual(run.state, 'done')
+        self.assertEqual(run.records_read, 10)
+        self.assertEqual(self._get_synced(), list(range(1, 11)))
+
+    def test_resume(self):
+        """A resumed shard starts after the last batch it committed"""
+        sync_rows = type(self.mapper)._sync_rows
+
+        def fail_row_7(mapper, data_list):
+            if any(data['id'] == 7 for data in data_list):
+                raise ValueError('Row 7')
+            return sync_rows(mapper, data_list)
+
+        self.mapper.get_data_for_sync()
+        run = self.mapper.sync_run_ids
+        jobs = self._get_jobs()
+        with patch.object(type(self.mapper), '_sync_rows', fail_row_7):
+            self._run_job(jobs[0])
+            with self.assertRaises(ValueError):
+                self._run_job(jobs[1])
+            jobs[1].state = 'failed'
+            self._run_job(jobs[2])
+        shard = run.shard_ids[1]
+        self.assertEqual(shard.last_key, '6')
+        self.assertEqual(run.state, 'failed')
+        self.assertEqual(self._get_synced(), [1, 2, 3, 4, 5, 6, 9, 10])
+        run.action_resume()
+        self.assertEqual(run.state, 'running')
+        self._run_jobs()
+        self.assertEqual(shard.state, 'done')
+        self.assertEqual(shard.last_key, '8')
+        self.assertEqual(self._get_synced(), list(range(1, 11)))
+        self.assertEqual(run.records_read, 10)
+        self.assertEqual(run.state, 'done')
@@ -0,0 +1,21 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from odoo.tests import common
+from ..tools.sync_cache import LRUCache
+
+
+class TestLRUCache(common.BaseCase):
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.get('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,54 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from odoo.tools import mute_logger
+from .common import SyncCase
+
+
+class TestSyncError(SyncCase):
+
+    def setUp(self):
+        super(TestSyncError, self).setUp()
+        # A partner without name can't be created
+        self._create_table('company', [('C1', 'Company 1'), ('C2', None)])
+        self._create_table('contact', [
+            ('P1', 'Contact 1', 'C1'),
+            ('P2', 'Contact 2', 'C2'),
+            ('P3', 'Contact 3', 'C1'),
+        ], columns=('code', 'name', 'parent_code'))
+        self.company_mapper = self._create_mapper('company')
+        self.contact_mapper = self._create_mapper(
+            'contact', parent=self.company_mapper, batch_size=10)
+
+    def _get_error(self):
+        return self.env['webservice.sync.error'].search([
+            ('mapper_id', '=', self.contact_mapper.id)])
+
+    @mute_logger('odoo.sql_db')
+    def test_failed_dependence(self):
+        """A dependence that fails only fails the rows that use it"""
+        self.contact_mapper.sync_data(res_id=['P1', 'P2', 'P3'])
+        partners = self._get_partners(['C1', 'C2', 'P1', 'P2', 'P3'])
+        self.assertEqual(sorted(partners), ['C1', 'P1', 'P3'])
+        self.assertEqual(partners['P1'].parent_id, partners['C1'])
+        self.assertEqual(partners['P3'].parent_id, partners['C1'])
+        error = self._get_error()
+        self.assertEqual(error.source_key, 'P2')
+        self.assertEqual(error.state, 'pending')
+
+    @mute_logger('odoo.sql_db')
+    def test_retry_errors(self):
+        """An error retried fails again until the source is fixed"""
+        self.contact_mapper.sync_data(res_id=['P1', 'P2', 'P3'])
+        error = self._get_error()
+        error.action_retry()
+        self.assertEqual(error.state, 'retrying')
+        self._run_jobs('webservice.sync.error')
+        self.assertEqual(error.state, 'pending')
+        self.assertEqual(error.attempts, 2)
+        self._execute("UPDATE company SET name = 'Company 2' "
+                      "WHERE code = 'C2'")
+        error.action_retry()
+        self._run_jobs('webservice.sync.error')
+        self.assertEqual(error.state, 'solved')
+        partners = self._get_partners(['C2', 'P2'])
+        self.assertEqual(partners['P2'].parent_id, partners['C2'])
@@ -0,0 +1,106 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from odoo.tests import common
+from ..tools.row_filter import compile_domain, domain_fields
+from ..tools.sql_domain import SQLDomainCompiler, count_params, \
+    split_in_domain
+
+
+class TestSQLDomain(common.BaseCase):
+
+    def setUp(self):
+        super(TestSQLDomain, self).setUp()
+        self.compiler = SQLDomainCompiler('[]', max_in=3)
+
+    def test_compile_leafs(self):
+        self.assertEqual(
+            self.compiler.compile([['a', '=', 1], ['b.c', 'ilike', 'x']]),
+            ('[a] = %s AND [b].[c] LIKE %s', [1, '%x%']))
+        self.assertEqual(self.compiler.compile([['a', '=', False]]),
+                         ('[a] IS NULL', []))
+        self.assertEqual(self.compiler.compile([['a', 'in', []]]),
+                         ('1=0', []))
+        self.assertEqual(self.compiler.compile([]), ('', []))
+
+    def test_compile_operators(self):
+        sql, params = self.compiler.compile(
+            ['|', ['a', '=', 1], '!', ['b', '>', 2], ['c', '<', 3]])
+        self.assertEqual(
+            sql, '([a] = %s OR (NOT [b] > %s)) AND [c] < %s')
+        self.assertEqual(params, [1, 2, 3])
+
+    def test_compile_in_with_none(self):
+        self.assertEqual(
+            self.compiler.compile([['a', 'in', [None, 1]]]),
+            ('([a] IN (%s) OR [a] IS NULL)', [1]))
+        self.assertEqual(
+            self.compiler.compile([['a', 'not in', [None, 1]]]),
+            ('([a] NOT IN (%s) AND [a] IS NOT NULL)', [1]))
+        self.assertEqual(self.compiler.compile([['a', 'in', [None]]]),
+                         ('[a] IS NULL', []))
+
+    def test_compile_big_in(self):
+        sql, params = self.compiler.compile([['a', 'in', [1, 2, 3, 4]]])
+        self.assertEqual(sql, '([a] IN (%s, %s, %s) OR [a] IN (%s))')
+        self.assertEqual(params, [1, 2, 3, 4])
+
+    def test_invalid_column(self):
+        with self.assertRaises(ValueError):
+            self.compiler.compile([['a; DROP TABLE b', '=', 1]])
+
+    def test_split_in_domain(self):
+        domain = [['a', 'in', list(range(10))], ['b', '=', 1]]
+        parts = list(split_in_domain(domain, 5))
+        self.assertTrue(all(count_params(part) <= 5 for part in parts))
+        self.assertEqual(
+            sorted(v for part in parts for v in part[0][2]),
+            list(range(10)))
+        self.assertEqual(list(split_in_domain(domain, 20)), [domain])
+
+    def test_split_several_in(self):
+        domain = [['a', 'in', list(range(30))],
+                  ['b', 'in', list(range(30))]]
+        parts = list(split_in_domain(domain, 20))
+        self.assertTrue(all(count_params(part) <= 20 for part in parts))
+        # Each pair of values is read by one query only
+        pairs = [(a, b) for part in parts
+                 for a in part[0][2] for b in part[1][2]]
+        self.assertEqual(len(pairs), 900)
+        self.assertEqual(len(set(pairs)), 900)
+
+    def test_split_with_operators(self):
+        domain = ['|', ['a', 'in', list(range(10))], ['b', '=', 1]]
+        self.assertEqual(list(split_in_domain(domain, 5)), [domain])
+
+
+class TestRowFilter(common.BaseCase):
+
+    def test_domain_fields(self):
+        self.assertEqual(
+            domain_fields(['|', ['a', '=', 1], [['b', '>', 2]]]),
+            {'a', 'b'})
+
+    def test_compile_domain(self):
+        match = compile_domain(
+            ['|', ['qty', '>', 5], ['name', 'ilike', 'ab']])
+        self.assertTrue(match({'qty': '7', 'name': 'x'}))
+        self.assertTrue(match({'qty': 1, 'name': 'xABy'}))
+        self.assertFalse(match({'qty': None, 'name': None}))
+        self.assertTrue(compile_domain([])({'a': 1}))
+
+    def test_compile_in(self):
+        match = compile_domain([['a', 'in', [None, 1]]])
+        self.assertTrue(match({'a': '1'}))
+        self.assertTrue(match({'a': None}))
+        self.assertFalse(match({'a': 2}))
+        not_match = compile_domain([['a', 'not in', [1]]])
+        self.assertTrue(not_match({'a': 2}))
+        self.assertFalse(not_match({'a': None}))
+
+    def test_compile_like(self):
+        self.assertTrue(compile_domain([['a', '=like', 'a%c']])(
+            {'a': 'abbc'}))
+        self.assertFalse(compile_domain([['a', '=like', 'a_c']])(
+            {'a': 'abbc'}))
+        self.assertTrue(compile_domain([['a', 'not like', 'x']])(
+            {'a': 'abc'}))
@@ -0,0 +1,50 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from .common import SyncCase, run_commit_handlers
+
+
+class TestWatermark(SyncCase):
+
+    def setUp(self):
+        super(TestWatermark, self).setUp()
+        self._create_table('contact', [
+            ('C%s' % i, 'Contact %s' % i, i) for i in range(1, 6)],
+            columns=('code', 'name', 'version INTEGER'))
+        self.mapper = self._create_mapper(
+            'contact', watermark_field='version', watermark_type='integer')
+
+    def test_advance_on_last_job(self):
+        """The watermark advances when the last job of the run ends"""
+        self.mapper.get_data_for_sync()
+        run = self.mapper.sync_run_ids
+        self.assertEqual(run.watermark, '5')
+        jobs = self._get_jobs()
+        self.assertEqual(len(jobs), 3)
+        # The jobs end in any order
+        for job in reversed(jobs[1:]):
+            self._run_job(job)
+            self.assertFalse(self.mapper.watermark_value)
+        self._run_job(jobs[0])
+        self.assertEqual(self.mapper.watermark_value, '5')
+        self.assertEqual(run.state, 'done')
+        # Only the rows changed since the last sync are read
+        self._execute("UPDATE contact SET name = 'New', version = 6 "
+                      "WHERE code = 'C2'")
+        self.mapper.get_data_for_sync()
+        self.assertEqual(len(self._get_jobs()), 1)
+        self._run_jobs()
+        self.assertEqual(self._get_partners(['C2'])['C2'].name, 'New')
+        self.assertEqual(self.mapper.watermark_value, '6')
+        self.assertEqual(self.mapper.sync_run_ids[0].records_read, 1)
+
+    def test_failed_run_done(self):
+        """A failed run is done when its jobs end after being requeued"""
+        self.mapper.get_data_for_sync()
+        run = self.mapper.sync_run_ids
+        run.add_failure(2)
+        run_commit_handlers(self.env)
+        run.invalidate_cache()
+        self.assertEqual(run.state, 'failed')
+        self._run_jobs()
+        self.assertEqual(run.state, 'done')
+        self.assertEqual(self.mapper.watermark_value, '5')
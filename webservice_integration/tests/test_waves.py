@@ -0,0 +1,51 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+from odoo.exceptions import UserError
+from .common import SyncCase
+
+
+class TestWaves(SyncCase):
+
+    def setUp(self):
+        super(TestWaves, self).setUp()
+        self._create_table('company', [('C1', 'Company 1'),
+                                       ('C2', 'Company 2')])
+        self._create_table('contact', [
+            ('P1', 'Contact 1', 'C1'),
+            ('P2', 'Contact 2', 'C2'),
+        ], columns=('code', 'name', 'parent_code'))
+        self._create_table('lead', [('L1', 'Lead 1')])
+        self.company_mapper = self._create_mapper('company', sequence=2)
+        self.contact_mapper = self._create_mapper(
+            'contact', parent=self.company_mapper, sequence=1)
+        self.lead_mapper = self._create_mapper('lead', sequence=3)
+
+    def test_waves(self):
+        """A mapper is synced in the wave after its dependences"""
+        self.assertEqual(self.instance._get_mapper_waves(), [
+            [self.company_mapper.id, self.lead_mapper.id],
+            [self.contact_mapper.id]])
+
+    def test_circular_dependence(self):
+        self.company_mapper.write({'mapper_fields_ids': [(0, 0, {
+            'odoo_field': self.partner_fields['parent_id'],
+            'source_field': 'name',
+            'dependence_id': self.contact_mapper.id,
+            'create_method': 'before'})]})
+        with self.assertRaises(UserError):
+            self.instance._get_mapper_waves()
+
+    def test_sync_waves(self):
+        """The contacts are synced when the companies are done and their
+        companies are searched"""
+        self.instance.action_sync_waves()
+        while self._get_jobs('webservice.instance'):
+            self._run_jobs('webservice.instance')
+            self._run_jobs()
+        partners = self._get_partners(['C1', 'C2', 'P1', 'P2', 'L1'])
+        self.assertEqual(len(partners), 5)
+        self.assertEqual(partners['P2'].parent_id, partners['C2'])
+        contact_run = self.contact_mapper.sync_run_ids
+        self.assertTrue(contact_run.lookup_dependences)
+        self.assertEqual(contact_run.state, 'done')
+        self.assertFalse(self.company_mapper.sync_run_ids.lookup_dependences)
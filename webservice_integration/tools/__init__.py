@@ -0,0 +1,13 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from . import connection_pool
+from . import jsonrpc
+from . import sync_cache
+from . import plan
+from . import sql_domain
+from . import row_hash
+from . import sync_stats
+from . import profiler
+from . import row_filter
+from . import diff_report
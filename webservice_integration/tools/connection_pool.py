@@ -0,0 +1,122 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Process wide pools of connexions to the webservice sources.
+
+The connexions are not bound to an Odoo environment so the functions used
+to open, check and close them are given by the caller on each checkout.
+"""
+import threading
+import time
+from collections import deque
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """Bounded pool of connexions. An idle connexion is checked before
+    being given and closed when it has not been used for max_idle seconds
+    """
+
+    def __init__(self, max_size=4, max_idle=300, timeout=300):
+        self.max_size = max(max_size, 1)
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = deque()
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def _pop_expired(self):
+        """Returns the idle connexions that have expired, the caller
+        closes them outside the lock"""
+        expired = []
+        limit = time.time() - self.max_idle
+        while self._idle and self._idle[0][1] < limit:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def acquire(self, connect, check=None, close=None):
+        """Returns a connexion of the pool or a new one from connect()"""
+        deadline = time.time() + self.timeout
+        with self._cond:
+            expired = self._pop_expired()
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        "No connexion available after %s seconds"
+                        % self.timeout)
+                self._cond.wait(remaining)
+            conn = self._idle.pop()[0] if self._idle else None
+            self._in_use += 1
+        for old_conn in expired:
+            self._close(old_conn, close)
+        try:
+            if conn is not None and check and not check(conn):
+                self._close(conn, close)
+                conn = None
+            if conn is None:
+                conn = connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, close=None, discard=False):
+        """Gives back a connexion to the pool, discarded connexions
+        are closed"""
+        with self._cond:
+            self._in_use -= 1
+            if not discard:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+        if discard:
+            self._close(conn, close)
+
+    def close_all(self, close=None):
+        with self._cond:
+            idle = [x[0] for x in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn, close)
+
+    def _close(self, conn, close):
+        if not close:
+            return
+        try:
+            close(conn)
+        except Exception as err:
+            _logger.info('Closing pooled connexion failed: %s', err)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, params_key, max_size=4, max_idle=300, timeout=300):
+    """Returns the pool for key. params_key identifies the access data,
+    when it changes a new pool is created and the old one returned as
+    second value to be closed by the caller"""
+    with _pools_lock:
+        old = _pools.get(key)
+        if old and old[0] == params_key:
+            pool = old[1]
+            pool.max_size = max(max_size, 1)
+            pool.max_idle = max_idle
+            pool.timeout = timeout
+            return pool, None
+        pool = ConnectionPool(max_size, max_idle, timeout)
+        _pools[key] = (params_key, pool)
+        return pool, old and old[1]
+
+
+def pop_pools(prefix):
+    """Removes and returns the pools whose key starts with prefix"""
+    with _pools_lock:
+        keys = [k for k in _pools if k[:len(prefix)] == prefix]
+        return [_pools.pop(k)[1] for k in keys]
@@ -0,0 +1,54 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Report of a dry run. Only the counters and a sample of the rows are
+kept, so its size doesn't depend on the size of the source."""
+from collections import Counter
+import random
+
+STATES = ['create', 'update', 'unchanged', 'skipped', 'error']
+
+
+class DiffReport(object):
+    """counts: rows by state
+    fields: updated rows by odoo field
+    samples: state -> list of (source key, {field: (old, new)}), each
+    list is a uniform sample of sample_size rows of the state"""
+
+    def __init__(self, sample_size=100, seed=None):
+        self.sample_size = max(sample_size, 0)
+        self.counts = Counter()
+        self.fields = Counter()
+        self.samples = {state: [] for state in STATES}
+        self._random = random.Random(seed)
+
+    def add(self, state, key, diffs=None):
+        self.counts[state] += 1
+        if state == 'update':
+            self.fields.update(list(diffs))
+        # Reservoir sampling, the row replaces a sampled one with
+        # probability sample_size / rows of the state
+        sample = self.samples[state]
+        if len(sample) < self.sample_size:
+            sample.append((key, diffs or {}))
+            return
+        pos = self._random.randrange(self.counts[state])
+        if pos < self.sample_size:
+            sample[pos] = (key, diffs or {})
+
+    def to_text(self, title=''):
+        lines = ['--DRY RUN OF %s--' % title if title else '--DRY RUN--']
+        lines += ['%s: %s' % (state, self.counts[state])
+                  for state in STATES]
+        if self.fields:
+            lines += ['', '--CHANGED FIELDS--']
+            lines += ['%s: %s' % (name, count)
+                      for name, count in self.fields.most_common()]
+        for state in STATES:
+            if not self.samples[state]:
+                continue
+            lines += ['', '--SAMPLE OF %s--' % state.upper()]
+            for key, diffs in self.samples[state]:
+                lines.append('%r' % (key,))
+                lines += ['    %s: %r -> %r' % (name, old, new)
+                          for name, (old, new) in sorted(diffs.items())]
+        return '\n'.join(lines)
@@ -0,0 +1,100 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Clients for the external API of Odoo with the same execute_kw
+signature than the xmlrpc ServerProxy of the object service."""
+import itertools
+import xmlrpc.client
+import logging
+_logger = logging.getLogger(__name__)
+try:
+    import requests
+except (ImportError, IOError) as err:
+    _logger.debug(err)
+
+
+class JsonRpcError(Exception):
+    pass
+
+
+class JsonRpcProxy(object):
+    """JSON-RPC client that keeps the HTTP connexion alive between calls
+    and accepts gzip responses"""
+
+    def __init__(self, host, timeout=300):
+        self.url = '{}/jsonrpc'.format(host)
+        self.timeout = timeout
+        self.bytes_received = 0
+        self._ids = itertools.count(1)
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+        })
+
+    def call(self, service, method, *args):
+        payload = {
+            'jsonrpc': '2.0',
+            'method': 'call',
+            'params': {'service': service, 'method': method, 'args': args},
+            'id': next(self._ids),
+        }
+        response = self.session.post(
+            self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        res = response.json()
+        # Bytes of the body as received, before decompressing it like
+        # the XML-RPC transport counts them
+        tell = getattr(response.raw, 'tell', None)
+        self.bytes_received += tell() if tell else len(response.content)
+        if res.get('error'):
+            error = res['error']
+            raise JsonRpcError(
+                error.get('data', {}).get('message') or error.get('message'))
+        return res.get('result')
+
+    def version(self):
+        return self.call('common', 'version')
+
+    def authenticate(self, db, user, password, env):
+        return self.call('common', 'authenticate', db, user, password, env)
+
+    def execute_kw(self, db, uid, password, model, method, args,
+                   kwargs=None):
+        return self.call('object', 'execute_kw', db, uid, password,
+                         model, method, args, kwargs or {})
+
+    def close(self):
+        self.session.close()
+
+
+class _CountingResponse(object):
+    """Wraps an HTTP response counting the bytes read from it"""
+
+    def __init__(self, response, transport):
+        self._response = response
+        self._transport = transport
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._transport.bytes_received += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class CountingTransport(xmlrpc.client.Transport):
+    """XML-RPC transport that counts the bytes received"""
+    bytes_received = 0
+
+    def parse_response(self, response):
+        return super(CountingTransport, self).parse_response(
+            _CountingResponse(response, self))
+
+
+def xmlrpc_proxy(host, service):
+    """Returns a ServerProxy for the service of host, the bytes received
+    are available in proxy('transport').bytes_received"""
+    return xmlrpc.client.ServerProxy(
+        '{}/xmlrpc/2/{}'.format(host, service),
+        transport=CountingTransport())
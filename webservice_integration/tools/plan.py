@@ -0,0 +1,64 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Execution plan of a mapper. It is built once per mapper and run from
+the configuration records, the sync loop only reads these tuples."""
+from collections import namedtuple
+
+FieldPlan = namedtuple('FieldPlan', [
+    'field_id',         # id of webservice.mapper.fields
+    'source',           # column of the source
+    'name',             # field name in odoo
+    'ttype',
+    'relation',         # related odoo model or False
+    'is_x2many',
+    'dependence_id',    # id of the mapper of the relation or False
+    'unique',
+    'search_operator',
+    'create_method',
+    'has_map',          # map_values is set
+])
+
+MapperPlan = namedtuple('MapperPlan', [
+    'mapper_id',
+    'model',            # odoo model name
+    'read_fields',      # tuple of source columns to read
+    'lazy_fields',      # source columns only read for new records
+    'fields',           # FieldPlan not relational
+    'relational',       # FieldPlan with relation
+    'before',           # FieldPlan by create method
+    'together',
+    'after',
+    'unique_fields',    # FieldPlan used in the search domain
+    'binary_fields',    # odoo names of binary fields
+    'search_field',     # field for search source keys in odoo
+    'unique_source_field',
+    'company_field',
+    'company_id',
+    'company_domain',
+    'update',
+    'create_active',
+    'method_calls',     # tuple of method names
+    'search_name',      # relations without mapper are searched by name
+    'use_row_hash',     # unchanged rows are skipped
+    'key_type',         # odoo type of the search field
+])
+
+# Conversions of the source keys read as text by the odoo type of the
+# field where they are searched
+KEY_TYPES = {
+    'integer': int,
+    'many2one': int,
+    'float': float,
+    'monetary': float,
+}
+
+
+def coerce_key(value, ttype):
+    """Converts a source key read as text, like the values of CSV files,
+    to the type of the odoo field where it is searched"""
+    if not isinstance(value, str) or ttype not in KEY_TYPES:
+        return value
+    try:
+        return KEY_TYPES[ttype](value)
+    except ValueError:
+        return value
@@ -0,0 +1,68 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Profiling of a function call with the python profiler and the time of
+the SQL queries executed by a cursor."""
+from contextlib import contextmanager
+import cProfile
+import io
+import pstats
+import time
+
+
+class SQLRecorder(object):
+    """Records the time of each query executed with the cursor"""
+
+    def __init__(self):
+        self.queries = []
+
+    @contextmanager
+    def record(self, cr):
+        execute = cr.execute
+
+        def timed_execute(query, params=None, *args, **kwargs):
+            start = time.time()
+            try:
+                return execute(query, params, *args, **kwargs)
+            finally:
+                self.queries.append((time.time() - start, query, params))
+        cr.execute = timed_execute
+        try:
+            yield self
+        finally:
+            del cr.execute
+
+    def total_time(self):
+        return sum(q[0] for q in self.queries)
+
+    def report(self, limit=20):
+        """Returns the summary of the queries grouped by statement and
+        the slowest statements"""
+        groups = {}
+        for duration, query, params in self.queries:
+            group = groups.setdefault(query, [0, 0.0])
+            group[0] += 1
+            group[1] += duration
+        lines = ['%s queries in %.3f s' % (
+            len(self.queries), self.total_time()), '',
+            '--STATEMENTS BY TOTAL TIME--']
+        for query, (count, duration) in sorted(
+                groups.items(), key=lambda x: -x[1][1])[:limit]:
+            lines.append('%.3f s  %s calls  %s' % (
+                duration, count, ' '.join(str(query).split())))
+        lines += ['', '--SLOWEST STATEMENTS--']
+        for duration, query, params in sorted(
+                self.queries, key=lambda x: -x[0])[:limit]:
+            lines.append('%.3f s  %s  %s' % (
+                duration, ' '.join(str(query).split()), params))
+        return '\n'.join(lines)
+
+
+def profile_call(func, *args, **kwargs):
+    """Calls func under the profiler. Returns the result, the profiler
+    and the stats sorted by cumulative time written as text"""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(60)
+    return result, profiler, stream.getvalue()
@@ -0,0 +1,113 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Filter of rows read from files with the same domains compiled to SQL
+by sql_domain. The values of the rows are compared with the type of the
+value of the domain, so text columns can be compared with numbers."""
+import re
+from .sql_domain import is_leaf
+
+
+def domain_fields(domain):
+    """Returns the set of columns used in the domain"""
+    if is_leaf(domain):
+        return {domain[0]}
+    res = set()
+    for element in domain or []:
+        if type(element) in (list, tuple):
+            res |= domain_fields(element)
+    return res
+
+
+def _coerce(value, like):
+    """Converts value to the type of like when it is possible"""
+    if value is None or like is None or isinstance(value, type(like)):
+        return value
+    try:
+        if isinstance(like, bool):
+            return str(value).lower() in ('1', 'true', 't', 'yes')
+        if isinstance(like, (int, float)):
+            return type(like)(value)
+        if isinstance(like, str):
+            return str(value)
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+def _like(pattern, value, case, exact):
+    """Matches value with the pattern of the like operators, % and _ are
+    wildcards when exact is set, otherwise the pattern is a substring"""
+    if value is None:
+        return False
+    if exact:
+        regex = ''.join('.*' if c == '%' else '.' if c == '_'
+                        else re.escape(c) for c in str(pattern))
+    else:
+        regex = '.*%s.*' % re.escape(str(pattern))
+    return re.match('^%s$' % regex, str(value),
+                    0 if case else re.IGNORECASE | re.DOTALL) is not None
+
+
+def _compare(value, operator, target):
+    if operator in ('in', 'not in'):
+        targets = target if type(target) in (list, tuple) else [target]
+        found = any(_coerce(value, t) == t if t is not None
+                    else value is None for t in targets)
+        return found if operator == 'in' else \
+            not found and value is not None
+    if (target is None or target is False) and \
+            operator in ('=', '!=', '<>'):
+        return (value is None) == (operator == '=')
+    if 'like' in operator:
+        match = _like(target, value, 'ilike' not in operator,
+                      operator.startswith('='))
+        return not match if operator.startswith('not') else match
+    if value is None:
+        return False
+    value = _coerce(value, target)
+    try:
+        if operator == '=':
+            return value == target
+        if operator in ('!=', '<>'):
+            return value != target
+        if operator == '>':
+            return value > target
+        if operator == '>=':
+            return value >= target
+        if operator == '<':
+            return value < target
+        if operator == '<=':
+            return value <= target
+    except TypeError:
+        return False
+    raise ValueError('Invalid operator %r' % operator)
+
+
+def compile_domain(domain):
+    """Returns a function that receives a row dict and returns if it
+    matches the domain"""
+    if not domain:
+        return lambda row: True
+    if is_leaf(domain):
+        domain = [domain]
+    stack = []
+    for element in reversed(domain):
+        if element == '!':
+            func = stack.pop()
+            stack.append(lambda row, f=func: not f(row))
+        elif element in ('&', '|'):
+            left, right = stack.pop(), stack.pop()
+            if element == '&':
+                stack.append(lambda row, a=left, b=right: a(row) and b(row))
+            else:
+                stack.append(lambda row, a=left, b=right: a(row) or b(row))
+        elif is_leaf(element):
+            column, operator, target = element
+            stack.append(
+                lambda row, c=column, o=operator.lower(), t=target:
+                _compare(row.get(c), o, t))
+        elif type(element) in (list, tuple):
+            stack.append(compile_domain(element))
+        else:
+            raise ValueError('Invalid domain element %r' % (element,))
+    return lambda row: all(f(row) for f in stack)
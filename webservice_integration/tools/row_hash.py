@@ -0,0 +1,20 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Content hash of the source rows, used to detect the rows that didn't
+change since they were synced."""
+import hashlib
+
+
+def row_hash(row, fields):
+    """Returns the hex digest of the values of fields in the row. The
+    names of the fields are part of the hash, so changing the mapped
+    columns changes the hash of every row"""
+    digest = hashlib.sha1()
+    for field in fields:
+        value = row.get(field)
+        digest.update(field.encode())
+        digest.update(b'\0')
+        digest.update(value if isinstance(value, bytes)
+                      else repr(value).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
@@ -0,0 +1,163 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Compiles Odoo like domains to parameterized SQL conditions.
+
+The domain is written in polish notation with the operators '&', '|'
+and '!', the leafs not joined with an operator are joined with AND.
+A list of leafs inside the domain is compiled as a sub-domain.
+"""
+import re
+
+IDENTIFIER = re.compile(r'^[A-Za-z_#@][A-Za-z0-9_#@$]*$')
+
+OPERATORS = {
+    '=': '=',
+    '!=': '<>',
+    '<>': '<>',
+    '>': '>',
+    '>=': '>=',
+    '<': '<',
+    '<=': '<=',
+    'like': 'LIKE',
+    'ilike': 'LIKE',
+    'not like': 'NOT LIKE',
+    'not ilike': 'NOT LIKE',
+    '=like': 'LIKE',
+    '=ilike': 'LIKE',
+    'in': 'IN',
+    'not in': 'NOT IN',
+}
+
+
+def is_leaf(element):
+    return (type(element) in (list, tuple) and len(element) == 3 and
+            isinstance(element[0], str) and isinstance(element[1], str) and
+            element[1].lower() in OPERATORS)
+
+
+class SQLDomainCompiler(object):
+    """quote: pair of characters used for quote identifiers
+    max_in: maximum number of values of an IN condition, bigger lists
+    are split in several IN joined with OR
+    placeholder: parameter marker of the database driver"""
+
+    def __init__(self, quote='""', max_in=1000, placeholder='%s'):
+        self.quote_chars = quote
+        self.max_in = max(max_in, 1)
+        self.placeholder = placeholder
+
+    def quote(self, name):
+        """Quotes the name of a table or column, names with several
+        parts are quoted part by part. Other expressions are returned
+        as they are"""
+        parts = name.split('.')
+        if not all(IDENTIFIER.match(part) for part in parts):
+            return name
+        return '.'.join('%s%s%s' % (self.quote_chars[0], part,
+                                    self.quote_chars[1]) for part in parts)
+
+    def compile(self, domain):
+        """Returns the SQL condition and the list of parameters"""
+        if not domain:
+            return '', []
+        if is_leaf(domain):
+            domain = [domain]
+        stack = []
+        for element in reversed(domain):
+            if element == '!':
+                sql, params = stack.pop()
+                stack.append(('(NOT %s)' % sql, params))
+            elif element in ('&', '|'):
+                left, right = stack.pop(), stack.pop()
+                stack.append(('(%s %s %s)' % (
+                    left[0], 'AND' if element == '&' else 'OR', right[0]),
+                    left[1] + right[1]))
+            elif is_leaf(element):
+                stack.append(self._compile_leaf(*element))
+            elif type(element) in (list, tuple):
+                sql, params = self.compile(element)
+                if sql:
+                    stack.append(('(%s)' % sql, params))
+            else:
+                raise ValueError('Invalid domain element %r' % (element,))
+        stack.reverse()
+        return (' AND '.join(x[0] for x in stack),
+                [p for x in stack for p in x[1]])
+
+    def _compile_leaf(self, column, operator, value):
+        if not all(IDENTIFIER.match(part) for part in column.split('.')):
+            raise ValueError('Invalid column name %r' % column)
+        column = self.quote(column)
+        operator = operator.lower()
+        sql_op = OPERATORS[operator]
+        if operator in ('in', 'not in'):
+            values = value if type(value) in (list, tuple) else [value]
+            # None matches the NULL values as in the Odoo domains
+            null = any(v is None for v in values)
+            values = [v for v in values if v is not None]
+            conditions = []
+            for i in range(0, len(values), self.max_in):
+                chunk = values[i:i + self.max_in]
+                conditions.append('%s %s (%s)' % (
+                    column, sql_op,
+                    ', '.join([self.placeholder] * len(chunk))))
+            if null:
+                conditions.append('%s IS %sNULL' % (
+                    column, '' if operator == 'in' else 'NOT '))
+            if not conditions:
+                return ('1=0' if operator == 'in' else '1=1'), []
+            sql = (' OR ' if operator == 'in' else ' AND ').join(conditions)
+            return ('(%s)' % sql if len(conditions) > 1 else sql), values
+        if (value is None or value is False) and \
+                operator in ('=', '!=', '<>'):
+            return '%s IS %sNULL' % (
+                column, '' if operator == '=' else 'NOT '), []
+        if operator in ('like', 'ilike', 'not like', 'not ilike'):
+            value = '%%%s%%' % value
+        return '%s %s %s' % (column, sql_op, self.placeholder), [value]
+
+
+def count_params(leafs):
+    """Maximum number of parameters of the leafs once compiled"""
+    count = 0
+    for leaf in leafs:
+        if not is_leaf(leaf):
+            continue
+        if leaf[1].lower() in ('in', 'not in') and \
+                type(leaf[2]) in (list, tuple):
+            count += len(leaf[2])
+        else:
+            count += 1
+    return count
+
+
+def split_in_domain(domain, size):
+    """Yields domains with at most size parameters splitting the values
+    of their IN conditions, so each query has a bounded number of
+    parameters. Domains with operators are not split"""
+    leafs = domain if domain and not is_leaf(domain) else [domain]
+    if any(x in ('&', '|', '!') for x in leafs) or \
+            count_params(leafs) <= size:
+        yield domain
+        return
+    in_leafs = [i for i, x in enumerate(leafs)
+                if is_leaf(x) and x[1].lower() == 'in' and
+                type(x[2]) in (list, tuple) and len(x[2]) > 1]
+    if not in_leafs:
+        yield domain
+        return
+    # The biggest IN is split, the parts are split again while they
+    # have too many parameters
+    pos = max(in_leafs, key=lambda i: len(leafs[i][2]))
+    column, operator, values = leafs[pos]
+    values = list(dict.fromkeys(values))
+    rest = count_params(leafs) - len(leafs[pos][2])
+    step = size - rest if rest < size else max(size // len(in_leafs), 1)
+    if step >= len(values):
+        yield domain
+        return
+    for i in range(0, len(values), step):
+        part = leafs[:pos] + [[column, operator, values[i:i + step]]] \
+            + leafs[pos + 1:]
+        for sub_domain in split_in_domain(part, size):
+            yield sub_domain
@@ -0,0 +1,78 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Caches shared by the synchronizations done in the same transaction"""
+from collections import OrderedDict
+from .sync_stats import SyncStats
+
+
+class LRUCache(object):
+    """Dict with a maximum size, the least recently used keys
+    are removed first"""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max(max_size, 1)
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+
+class SyncContext(object):
+    """Objects of a sync run
+    xref: (odoo model, search field, source value) -> odoo id
+    synced: (mapper id, source value) -> odoo id of the records
+        already synchronized in the run
+    plans: mapper id -> execution plan of the mapper
+    stats: counters and timers of the run
+    names: odoo model -> index of normalized display name -> odoo id,
+        None when the name is ambiguous
+    rows: (mapper id, source value) -> source row prefetched for the
+        dependences of a batch
+    syncing: (mapper id, source value) of the dependences being synced,
+        avoids syncing them again from circular dependences
+    """
+
+    def __init__(self, max_size=100000):
+        self.xref = LRUCache(max_size)
+        self.synced = LRUCache(max_size)
+        self.plans = {}
+        self.stats = SyncStats()
+        self.names = {}
+        self.rows = LRUCache(max_size)
+        self.syncing = set()
+
+    def clear_records(self):
+        """Drops the ids of odoo records, used when the records written
+        in a savepoint are rolled back"""
+        self.xref.clear()
+        self.synced.clear()
+        self.rows.clear()
+        self.names.clear()
+
+
+def normalize_name(name):
+    """Name compared without case and repeated spaces"""
+    return ' '.join(str(name).split()).lower()
@@ -0,0 +1,66 @@
+# Copyright 2020 Jesus Ramoneda <jesus.ramoneda@qubiq.es>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Counters and timers of a sync run."""
+from collections import defaultdict
+from contextlib import contextmanager
+import time
+import logging
+_logger = logging.getLogger(__name__)
+try:
+    import resource
+except (ImportError, IOError) as err:
+    resource = None
+    _logger.debug(err)
+
+# Time spent in the dependences includes the read and write of the
+# related records, it isn't counted in the phases of the mapper
+NESTED_PHASE = 'dependence'
+
+
+class SyncStats(object):
+    """The timers are exclusive, when a phase starts inside other one the
+    time of the outer phase is paused until the inner one ends"""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+        self._stack = []
+
+    @property
+    def nested(self):
+        return NESTED_PHASE in (name for name, start in self._stack)
+
+    def count(self, name, value=1):
+        if not self.nested:
+            self.counts[name] += value
+
+    @contextmanager
+    def timer(self, name):
+        if self.nested:
+            yield
+            return
+        now = time.time()
+        if self._stack:
+            outer, start = self._stack[-1]
+            self.times[outer] += now - start
+        self._stack.append((name, now))
+        try:
+            yield
+        finally:
+            name, start = self._stack.pop()
+            now = time.time()
+            self.times[name] += now - start
+            if self._stack:
+                self._stack[-1] = (self._stack[-1][0], now)
+
+    def reset(self):
+        self.counts.clear()
+        self.times.clear()
+        del self._stack[:]
+
+
+def peak_memory():
+    """Peak resident memory of the process in MB"""
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
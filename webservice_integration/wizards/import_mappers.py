@@ -32,26 +32,22 @@ class ImportMappers(models.TransientModel):
     def create_field(self, model, field_val):
         """Create a fields for a mapper"""
         mapper_field_obj = self.env['webservice.mapper.fields']
-        fields_obj = self.env['ir.model.fields']
-        field_id = fields_obj.search([
-            ('name', '=', field_val['odoo_field']),
-            ('model', '=', model),
-        ])
+        metadata = self.env['webservice.metadata']
+        field_id = self.env['ir.model.fields'].browse(
+            metadata.get_field_id(model, field_val['odoo_field']))
         if not field_id:
             if field_val['odoo_field'] == "x_old_id":
-                model_obj = self.env['ir.model'].search([
-                    ('model', '=', model)
-                ]),
                 field_id = field_id.sudo().create({
                     'name': 'x_old_id',
                     'field_description': 'Old ID',
                     'model': model,
-                    'model_id': model_obj[0].id,
+                    'model_id': metadata.get_model_id(model),
                     'ttype': 'integer',
                     'store': True,
                     'index': True,
                     'state': 'manual'
                 })
+                metadata.clear_caches()
             else:
                 raise UserError('Field %s from model %s not found' %
                                 (field_val['odoo_field'], model))